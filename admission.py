@@ -0,0 +1,147 @@
+"""
+Admission control in front of the inference path.
+
+Without a limit, a traffic spike piles humanize requests up inside the worker:
+memory grows with every waiting request and, once the backlog is deep enough,
+every request times out together. AdmissionController lets at most
+ADMISSION_MAX_CONCURRENT requests into segmentation/paraphrasing at once and
+keeps up to ADMISSION_MAX_QUEUE more waiting in FIFO order. Requests are shed
+early instead of late:
+- wait queue full: 429 right away
+- no slot within the queue-time budget (ADMISSION_QUEUE_TIMEOUT_MS): 503
+Both carry a Retry-After header. Accepted requests thus see a bounded queueing
+delay on top of their own inference time.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from metrics import ADMISSION_SHED, ADMISSION_WAIT
+
+# 0 disables admission control
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 32))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", 2000))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 1))
+
+
+class AdmissionRejected(HTTPException):
+    """A request shed by admission control (429 or 503 with Retry-After)"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = ADMISSION_RETRY_AFTER):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+class AdmissionTicket:
+    """An admitted request's slot; release() is idempotent"""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue and a queue-time budget"""
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS, retry_after: int = ADMISSION_RETRY_AFTER):
+        self.max_concurrent = max(0, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = max(0.0, queue_timeout_ms) / 1000
+        self.retry_after = retry_after
+        self._active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "queue_timeout": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    async def acquire(self, endpoint: str) -> AdmissionTicket:
+        """Wait for a slot; raise AdmissionRejected if the queue is full or the wait runs over budget"""
+        if not self.enabled or (self._active < self.max_concurrent and not self._waiters):
+            self._active += 1
+            self.admitted += 1
+            ADMISSION_WAIT.observe(0.0, endpoint)
+            return AdmissionTicket(self)
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(endpoint, "queue_full")
+            raise AdmissionRejected(
+                429, f"Server is busy ({len(self._waiters)} requests waiting), retry later", self.retry_after
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait([waiter], timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot that was handed over in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+
+        if not waiter.done():
+            self._discard(waiter)
+            self._reject(endpoint, "queue_timeout")
+            raise AdmissionRejected(
+                503, f"Server is busy (no capacity within {self.queue_timeout * 1000:.0f} ms), retry later",
+                self.retry_after
+            )
+        # _release() handed its slot straight to this waiter, so _active already counts it
+        self.admitted += 1
+        ADMISSION_WAIT.observe(time.perf_counter() - start, endpoint)
+        return AdmissionTicket(self)
+
+    @asynccontextmanager
+    async def admit(self, endpoint: str):
+        """Hold a slot for the duration of the with-block"""
+        ticket = await self.acquire(endpoint)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _release(self):
+        # Hand the slot to the oldest waiter, if any, instead of freeing it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def _discard(self, waiter):
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _reject(self, endpoint: str, reason: str):
+        self.shed[reason] += 1
+        ADMISSION_SHED.inc(endpoint, reason)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_ms": self.queue_timeout * 1000,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
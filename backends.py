@@ -0,0 +1,198 @@
+"""
+Pluggable paraphrase and detection backends.
+
+main.py is the only app; what produces /humanize and /detect-ai results is
+chosen by configuration (main_dummy.py just selects the dummy backends):
+- PARAPHRASE_BACKEND: parrot (the Parrot models on INFERENCE_BACKEND) or dummy
+  (sentences come back unchanged, only reformatted; no model is loaded)
+- PARAPHRASE_BATCHING: batched wrapper (ParaphraseBatcher, cross-request
+  micro-batching) when true, otherwise one engine call per request
+- PARAPHRASE_CACHE_ENABLED: cached wrapper (ParaphraseCache) in front of either
+- DETECTION_BACKEND: winston or dummy (random scores, no API calls)
+- DETECTION_CACHE_ENABLED: cached wrapper (DetectionCache) in front of either
+
+Engines are synchronous and run on the inference pool. Paraphrasers and
+detectors are async and are stacked: metered -> cached -> batched/direct -> engine.
+"""
+import os
+import random
+import time
+from typing import List, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from metrics import UPSTREAM_LATENCY, UPSTREAM_REQUESTS
+from paraphrase_cache import cache_key
+from quality_tiers import QualityTier, get_tier, tier_metrics
+
+PARAPHRASE_BACKEND = os.getenv("PARAPHRASE_BACKEND", "parrot").lower()
+PARAPHRASE_BATCHING = os.getenv("PARAPHRASE_BATCHING", "true").lower() in ("1", "true", "yes")
+PARAPHRASE_CACHE_ENABLED = os.getenv("PARAPHRASE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "winston").lower()
+DETECTION_CACHE_ENABLED = os.getenv("DETECTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+PARAPHRASE_BACKENDS = ("parrot", "dummy")
+DETECTION_BACKENDS = ("winston", "dummy")
+
+
+# Paraphrase engines (synchronous, run on the inference pool)
+
+class DummyEngine:
+    """Returns every sentence as its own only paraphrase"""
+
+    settings = {"model_tag": "dummy"}
+
+    def paraphrase_batch(self, sentences: Sequence[str], **settings) -> List[List[Tuple[str, int]]]:
+        return [[(sentence, 0)] for sentence in sentences]
+
+
+def load_engine(name: str = PARAPHRASE_BACKEND):
+    """Load the paraphrase engine for PARAPHRASE_BACKEND"""
+    if name == "parrot":
+        from inference_backends import INFERENCE_BACKEND, load_parrot
+        from paraphrase_engine import BatchParaphraser
+
+        return BatchParaphraser(load_parrot(INFERENCE_BACKEND), backend=INFERENCE_BACKEND)
+    if name == "dummy":
+        return DummyEngine()
+    raise ValueError(f"Unknown PARAPHRASE_BACKEND {name!r}, expected one of {', '.join(PARAPHRASE_BACKENDS)}")
+
+
+# Paraphrasers (async, used by the endpoints)
+
+class Paraphraser:
+    """Async paraphrasing of a list of sentences at a quality tier"""
+
+    async def paraphrase(self, sentences: Sequence[str], tier: QualityTier = None,
+                         priority: str = None) -> List[List[Tuple[str, int]]]:
+        """priority is the scheduling class (see batch_scheduler.py); paraphrasers without a queue ignore it"""
+        raise NotImplementedError
+
+
+class DirectParaphraser(Paraphraser):
+    """One engine call per request on the inference pool, no cross-request batching"""
+
+    def __init__(self, engine, executor):
+        self.engine = engine
+        self.executor = executor
+
+    async def paraphrase(self, sentences, tier=None, priority=None):
+        if not sentences:
+            return []
+        tier = tier or get_tier()
+        return await self.executor.run(self.engine.paraphrase_batch, list(sentences), **tier.settings)
+
+
+class CachedParaphraser(Paraphraser):
+    """Serves sentences from a ParaphraseCache and sends only the misses to the inner paraphraser"""
+
+    def __init__(self, inner, cache, settings: dict):
+        self.inner = inner
+        self.cache = cache
+        # Engine settings; the tier's settings are added per request
+        self.settings = settings
+
+    async def paraphrase(self, sentences, tier=None, priority=None):
+        tier = tier or get_tier()
+        settings = {**self.settings, **tier.settings}
+        keys = [cache_key(sentence, settings) for sentence in sentences]
+        results = await self.cache.lookup(keys)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        tier_metrics.record_cached(tier, len(sentences) - len(missing))
+        if missing:
+            generated = await self.inner.paraphrase([sentences[i] for i in missing], tier, priority)
+            for i, result in zip(missing, generated):
+                results[i] = result
+            self.cache.store([(keys[i], results[i]) for i in missing])
+        return results
+
+
+class MeteredParaphraser(Paraphraser):
+    """Records per-tier request latency against the tier's budget"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def paraphrase(self, sentences, tier=None, priority=None):
+        tier = tier or get_tier()
+        start = time.perf_counter()
+        results = await self.inner.paraphrase(sentences, tier, priority)
+        tier_metrics.record(tier, len(sentences), (time.perf_counter() - start) * 1000)
+        return results
+
+
+# Detectors
+
+class Detector:
+    """Async AI-content detection of one text"""
+
+    def check_config(self):
+        """Raise an HTTPException if the detector cannot be used (checked before debiting credits)"""
+
+    async def detect(self, text: str) -> dict:
+        raise NotImplementedError
+
+
+class WinstonDetector(Detector):
+    """Winston AI over the pooled WinstonClient"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def check_config(self):
+        if not os.getenv("WINSTON_AI_TOKEN"):
+            raise HTTPException(status_code=500, detail="WINSTON_AI_TOKEN not found in environment variables")
+
+    async def detect(self, text):
+        try:
+            with UPSTREAM_LATENCY.time("winston"):
+                response = await self.client.detect(text, os.getenv("WINSTON_AI_TOKEN"))
+        except Exception:
+            UPSTREAM_REQUESTS.inc("winston", "error")
+            raise
+        UPSTREAM_REQUESTS.inc("winston", "ok" if response.status_code == 200 else f"http_{response.status_code}")
+
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Winston AI API error: {response.text}"
+            )
+        return response.json()
+
+
+class DummyDetector(Detector):
+    """Random scores in Winston AI's response format"""
+
+    async def detect(self, text):
+        sentences = [s for s in text.split(".") if s.strip()]
+        return {
+            "status": 200,
+            "length": len(text),
+            "score": round(random.uniform(0, 100), 1),
+            "sentences": [
+                {"length": len(s), "score": round(random.uniform(0, 100), 2), "text": s.strip()}
+                for s in sentences
+            ],
+            "input": text,
+            "attack_detected": {"zero_width_space": False, "homoglyph_attack": False},
+            "readability_score": round(random.uniform(50, 90), 2),
+            "credits_used": len(text.split()),
+            "credits_remaining": 0,
+            "version": "1.0",
+            "language": "en",
+        }
+
+
+class CachedDetector(Detector):
+    """Serves identical texts from a DetectionCache; concurrent identical checks share one call"""
+
+    def __init__(self, inner, cache):
+        self.inner = inner
+        self.cache = cache
+
+    def check_config(self):
+        self.inner.check_config()
+
+    async def detect(self, text):
+        return await self.cache.get_or_fetch(text, lambda: self.inner.detect(text))
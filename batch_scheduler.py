@@ -0,0 +1,255 @@
+"""
+Cross-request micro-batching and priority scheduling in front of the paraphrase engine.
+
+Concurrent /humanize calls often carry only 1-3 sentences each. Instead of
+running each request's sentences as its own small batch, every sentence is put
+in a shared pending set. Once a batch slot is free, the dispatcher waits until
+BATCH_MAX_SIZE sentences are pending or the oldest one has waited
+BATCH_MAX_WAIT_MS, takes up to BATCH_MAX_SIZE sentences as one batch, runs it
+through the engine on the inference pool, and hands each result back to the
+request that asked for it. Sentences of different quality tiers share the
+pending set but never a batch.
+
+At most BATCH_MAX_IN_FLIGHT batches run at once, so under load sentences wait
+here, where the order is chosen, rather than first-come-first-served in the
+inference pool. Every sentence has a priority class:
+- paid: interactive requests of users on the paid plan
+- free: interactive requests of everyone else
+- bulk: background jobs
+Classes share the engine by weighted-fair queuing (PRIORITY_WEIGHTS): each
+sentence gets a virtual finish tag 1/weight after the previous one of its class,
+and batches are filled in tag order. With the default weights, paid sentences
+get 8 of every 11 places in contended batches, free 2 and bulk 1, so no class
+is ever shut out. On top of that, a sentence that has waited PRIORITY_MAX_WAIT_MS
+goes ahead of all others (oldest first), which bounds the wait of every class.
+This is the batched paraphraser of backends.py; caching is layered in front of it.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from metrics import MODEL_BATCH_LATENCY, MODEL_BATCH_SIZE, MODEL_ERRORS, PRIORITY_AGED, PRIORITY_QUEUE_WAIT
+from quality_tiers import QualityTier, get_tier
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 10))
+# 0 allows one batch per inference pool worker
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", 0))
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse "paid:8,free:2,bulk:1" into {"paid": 8.0, "free": 2.0, "bulk": 1.0}"""
+    weights = {}
+    for part in spec.split(","):
+        if part.strip():
+            name, weight = part.split(":", 1)
+            weights[name.strip()] = max(0.01, float(weight))
+    return weights
+
+
+PRIORITY_WEIGHTS = parse_weights(os.getenv("PRIORITY_WEIGHTS", "paid:8,free:2,bulk:1"))
+# Class of sentences queued without one, or with a class not in PRIORITY_WEIGHTS
+PRIORITY_DEFAULT = os.getenv("PRIORITY_DEFAULT", "free")
+PRIORITY_MAX_WAIT_MS = float(os.getenv("PRIORITY_MAX_WAIT_MS", 2000))
+
+
+class _Pending(NamedTuple):
+    tag: float  # virtual finish time
+    seq: int  # arrival order, breaks ties
+    enqueued: float  # loop time
+    priority: str
+    sentence: str
+    tier: QualityTier
+    future: asyncio.Future
+
+
+class ParaphraseBatcher:
+    """Collects sentences from concurrent requests into shared engine batches, in weighted-fair order"""
+
+    def __init__(self, engine, executor, max_batch: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, max_in_flight: int = BATCH_MAX_IN_FLIGHT,
+                 weights: Dict[str, float] = None, default_priority: str = PRIORITY_DEFAULT,
+                 max_priority_wait_ms: float = PRIORITY_MAX_WAIT_MS):
+        self.engine = engine
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_in_flight = max_in_flight if max_in_flight > 0 else executor.max_workers
+        self.weights = dict(weights or PRIORITY_WEIGHTS)
+        self.weights.setdefault(default_priority, 1.0)
+        self.default_priority = default_priority
+        self.max_priority_wait = max(0.0, max_priority_wait_ms) / 1000
+        self._pending: List[_Pending] = []
+        self._arrived = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._virtual_time = 0.0
+        self._last_tag = {priority: 0.0 for priority in self.weights}
+        self._seq = 0
+        self._dispatcher = None
+        self._batches = set()
+        self.batches_run = 0
+        self.sentences_run = 0
+        self.dispatched = {priority: 0 for priority in self.weights}
+        self.aged = {priority: 0 for priority in self.weights}
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    async def paraphrase(self, sentences: Sequence[str], tier: QualityTier = None,
+                         priority: str = None) -> List[List[Tuple[str, int]]]:
+        """Queue sentences for the next batches of their tier and wait for their paraphrases"""
+        if not sentences:
+            return []
+        tier = tier or get_tier()
+        if priority not in self.weights:
+            priority = self.default_priority
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        futures = []
+        for sentence in sentences:
+            # A class idle for a while restarts at the current virtual time instead of banking credit
+            tag = max(self._virtual_time, self._last_tag[priority]) + 1 / self.weights[priority]
+            self._last_tag[priority] = tag
+            self._seq += 1
+            future = loop.create_future()
+            self._pending.append(_Pending(tag, self._seq, now, priority, sentence, tier, future))
+            futures.append(future)
+        self._arrived.set()
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                while not self._pending:
+                    self._arrived.clear()
+                    await self._arrived.wait()
+
+                # Let the batch fill until the oldest pending sentence has waited max_wait
+                deadline = min(item.enqueued for item in self._pending) + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    self._arrived.clear()
+                    try:
+                        await asyncio.wait_for(self._arrived.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+
+                tier, batch = self._next_batch(loop.time())
+            except BaseException:
+                self._slots.release()
+                raise
+
+            if not batch:
+                self._slots.release()
+                continue
+            # Run the batch in the background; its slot is freed when it finishes
+            task = asyncio.create_task(self._run_batch(tier, batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task):
+        self._batches.discard(task)
+        self._slots.release()
+
+    def _next_batch(self, now: float) -> Tuple[QualityTier, List[_Pending]]:
+        """Take the next batch: overdue sentences oldest first, then the rest by finish tag"""
+        # Drop sentences whose request was cancelled while waiting
+        self._pending = [item for item in self._pending if not item.future.done()]
+        if not self._pending:
+            return None, []
+
+        overdue = now - self.max_priority_wait
+        self._pending.sort(
+            key=lambda item: (0, item.enqueued, item.seq) if item.enqueued <= overdue else (1, item.tag, item.seq)
+        )
+        # Each tier's settings need their own engine call; the first sentence picks the tier
+        tier = self._pending[0].tier
+        batch, rest = [], []
+        for item in self._pending:
+            if len(batch) < self.max_batch and item.tier.name == tier.name:
+                batch.append(item)
+            else:
+                rest.append(item)
+        self._pending = rest
+
+        for item in batch:
+            self.dispatched[item.priority] += 1
+            PRIORITY_QUEUE_WAIT.observe(now - item.enqueued, item.priority)
+            if item.enqueued <= overdue:
+                # Served out of turn; the virtual clock only follows sentences served in tag order
+                self.aged[item.priority] += 1
+                PRIORITY_AGED.inc(item.priority)
+            else:
+                self._virtual_time = max(self._virtual_time, item.tag)
+        return tier, batch
+
+    async def _run_batch(self, tier, batch: List[_Pending]):
+        # Skip sentences whose request was cancelled while waiting for a slot
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        try:
+            results = await self.executor.run(
+                self.engine.paraphrase_batch, [item.sentence for item in batch], **tier.settings
+            )
+        except Exception as e:
+            MODEL_ERRORS.inc(tier.name)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        MODEL_BATCH_LATENCY.observe(time.perf_counter() - start, tier.name)
+        MODEL_BATCH_SIZE.observe(len(batch), tier.name)
+        self.batches_run += 1
+        self.sentences_run += len(batch)
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+
+    def pending_by_priority(self) -> Dict[str, int]:
+        counts = {priority: 0 for priority in self.weights}
+        for item in self._pending:
+            counts[item.priority] += 1
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": len(self._batches),
+            "pending": len(self._pending),
+            "batches_run": self.batches_run,
+            "sentences_run": self.sentences_run,
+            "avg_batch_size": self.sentences_run / self.batches_run if self.batches_run else 0,
+            "priority": {
+                "weights": dict(self.weights),
+                "max_wait_ms": self.max_priority_wait * 1000,
+                "pending": self.pending_by_priority(),
+                "dispatched": dict(self.dispatched),
+                "aged": dict(self.aged),
+            },
+        }
@@ -0,0 +1,131 @@
+"""
+Compare the torch, int8 and onnx inference backends for latency, memory and quality.
+
+Each backend runs in its own subprocess so memory numbers are not mixed up.
+Reported per backend:
+- load_seconds, rss_mb (resident memory after loading and running)
+- seconds_per_sentence over the corpus
+- paraphrased_rate: share of sentences where a candidate passed both filters
+- top_match_vs_torch: share of sentences whose top paraphrase equals the fp32
+  torch backend's, using deterministic diverse beam search (do_diverse=True)
+
+Usage:
+  python benchmarks/inference_backend_benchmark.py
+  python benchmarks/inference_backend_benchmark.py --backends torch int8 onnx --repeat 3 --json backends.json
+
+The onnx backend needs `python download_models.py --onnx` first.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMPLE_SENTENCES = [
+    "Can you recommend some upscale restaurants in New York?",
+    "What are the famous places we should not miss in Russia?",
+    "He graduated from the University of Pennsylvania in 1997.",
+    "Artificial intelligence has transformed many industries.",
+    "The meeting starts at nine on Monday morning.",
+    "Please bring the quarterly report and your laptop.",
+    "Future work will explore larger models and more data.",
+    "The proposed method reduces latency while keeping accuracy close to the baseline.",
+]
+
+
+def run_worker(backend, sentences, model_dir):
+    """Load one backend, paraphrase the corpus and print the results as JSON"""
+    import torch
+
+    from inference_backends import load_parrot
+    from paraphrase_engine import BatchParaphraser
+
+    start = time.perf_counter()
+    engine = BatchParaphraser(load_parrot(backend, model_dir), backend=backend)
+    load_seconds = time.perf_counter() - start
+
+    # Warm up so lazy initialisation is not counted
+    engine.paraphrase_batch(sentences[:2])
+
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    results = engine.paraphrase_batch(sentences)
+    seconds = time.perf_counter() - start
+
+    top = [phrases[0][0] for phrases in engine.paraphrase_batch(sentences, do_diverse=True)]
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(json.dumps({
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "rss_mb": round(rss_mb),
+        "seconds_per_sentence": round(seconds / len(sentences), 4),
+        "paraphrased_rate": round(
+            sum(1 for sentence, phrases in zip(sentences, results) if phrases[0][0] != sentence) / len(sentences), 4
+        ),
+        "top": top,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--corpus", help="Text file with one sentence per line")
+    parser.add_argument("--repeat", type=int, default=2, help="Times to repeat the corpus (default: 2)")
+    parser.add_argument("--model-dir", default=os.getenv("OPTIMIZED_MODEL_DIR", os.path.join(ROOT, "optimized_models")))
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+    else:
+        sentences = list(SAMPLE_SENTENCES)
+    sentences = sentences * max(1, args.repeat)
+
+    if args.worker:
+        run_worker(args.worker, sentences, args.model_dir)
+        return
+
+    print(f"Paraphrasing {len(sentences)} sentences per backend")
+    results = []
+    for backend in args.backends:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", backend,
+                   "--repeat", str(args.repeat), "--model-dir", args.model_dir]
+        if args.corpus:
+            command += ["--corpus", args.corpus]
+        proc = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    reference = next((r["top"] for r in results if r["backend"] == "torch"), None)
+    for result in results:
+        top = result.pop("top")
+        if reference is not None:
+            result["top_match_vs_torch"] = round(sum(a == b for a, b in zip(top, reference)) / len(top), 4)
+
+    print()
+    print(f"{'backend':<8} {'load s':>7} {'RSS MB':>7} {'s/sentence':>11} {'paraphrased':>12} {'match torch':>12}")
+    for result in results:
+        print(
+            f"{result['backend']:<8} {result['load_seconds']:>7.2f} {result['rss_mb']:>7} "
+            f"{result['seconds_per_sentence']:>11.4f} {result['paraphrased_rate']:>12.2%} "
+            f"{result.get('top_match_vs_torch', float('nan')):>12.2%}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"sentences": len(sentences), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
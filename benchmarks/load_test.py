@@ -0,0 +1,330 @@
+"""
+Reproducible load test for the API.
+
+Starts main.py in-process behind a real uvicorn server, with:
+- a deterministic stub paraphraser (fixed cost per batch and per sentence,
+  no model download) in place of Parrot, like main_dummy.py
+- the rule-based sentencizer for segmentation
+- a temporary SQLite database (or --database-url, e.g. a local Postgres)
+- a local fake Winston AI server with a fixed response latency
+
+Everything else is the real code path: quota accounting, batching, caches,
+serialization and scheduling. Concurrent clients send a configurable mix of
+endpoints and document sizes; the report gives throughput and p50/p95/p99
+latency per endpoint as JSON. Compare reports across commits to catch
+regressions. Client and server share one process, so use the numbers for
+comparison, not capacity planning.
+
+Usage:
+  python benchmarks/load_test.py
+  python benchmarks/load_test.py --concurrency 32 --duration 30 \\
+      --endpoints humanize=5,detect-ai=3,humanize/batch=1,user-usage=1 \\
+      --sizes short=6,medium=3,long=1 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Sentences per document for each size
+DOCUMENT_SIZES = {"short": 2, "medium": 8, "long": 30}
+
+WORDS = (
+    "the a model system user data result method paper team report service network "
+    "quickly carefully often rarely improves reduces explains describes measures builds "
+    "new large small fast simple robust modern early final important"
+).split()
+
+
+class StubParaphraser:
+    """Deterministic stand-in for BatchParaphraser with a fixed compute cost"""
+
+    def __init__(self, batch_ms: float, sentence_ms: float):
+        self.batch_ms = batch_ms
+        self.sentence_ms = sentence_ms
+
+    @property
+    def settings(self) -> dict:
+        return {"model_tag": "stub"}
+
+    def paraphrase_batch(self, sentences, **settings):
+        # Sleeping releases the GIL like real model inference does
+        time.sleep((self.batch_ms + self.sentence_ms * len(sentences)) / 1000)
+        results = []
+        for sentence in sentences:
+            words = sentence.rstrip(".").split()
+            results.append([(" ".join(words[1:] + words[:1]).lower(), len(words))])
+        return results
+
+
+def parse_mix(value: str, choices) -> dict:
+    """Parse 'name=weight,name=weight' into {name: weight}"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in choices:
+            raise argparse.ArgumentTypeError(f"unknown {name!r}, expected one of {', '.join(choices)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fake_winston_app(latency_ms: float):
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.post("/detect")
+    async def detect(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        text = body["text"]
+        return {
+            "status": 200,
+            "length": len(text),
+            "score": 42.0,
+            "sentences": [{"length": len(text), "score": 42.0, "text": text}],
+            "input": "text",
+            "attack_detected": {"zero_width_space": False, "homoglyph_attack": False},
+            "readability_score": 60.0,
+            "credits_used": len(text.split()),
+            "credits_remaining": 1000000,
+            "version": "fake",
+            "language": "en",
+        }
+
+    return app
+
+
+async def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, endpoints: dict, sizes: dict, users: int, batch_items: int,
+                 tier: str, seed: int):
+        self.base_url = base_url
+        self.endpoints = endpoints
+        self.sizes = sizes
+        self.users = [f"loadtest-user-{i}" for i in range(users)]
+        self.batch_items = batch_items
+        self.tier = tier
+        self.random = random.Random(seed)
+        self.counter = 0
+        # Users with a usage row, so /user-usage does not 404
+        self.known_users = []
+        # endpoint -> (latencies in seconds, status code counts)
+        self.results = {}
+
+    def document(self) -> str:
+        size = self.random.choices(list(self.sizes), weights=list(self.sizes.values()))[0]
+        self.counter += 1
+        sentences = []
+        for i in range(DOCUMENT_SIZES[size]):
+            words = [self.random.choice(WORDS) for _ in range(self.random.randint(6, 14))]
+            # A unique token keeps identical texts from being served by the caches
+            words.append(f"doc{self.counter}s{i}")
+            sentences.append(" ".join(words).capitalize() + ".")
+        return " ".join(sentences)
+
+    def request(self):
+        endpoint = self.random.choices(list(self.endpoints), weights=list(self.endpoints.values()))[0]
+        user_id = self.random.choice(self.users)
+        tier = {"tier": self.tier} if self.tier else {}
+        if endpoint == "humanize":
+            return endpoint, "POST", "/humanize", {"text": self.document(), "user_id": user_id, **tier}
+        if endpoint == "humanize/stream":
+            return endpoint, "POST", "/humanize/stream", {"text": self.document(), "user_id": user_id, **tier}
+        if endpoint == "humanize/batch":
+            texts = [self.document() for _ in range(self.batch_items)]
+            return endpoint, "POST", "/humanize/batch", {"texts": texts, "user_id": user_id, **tier}
+        if endpoint == "detect-ai":
+            return endpoint, "POST", "/detect-ai", {"text": self.document(), "user_id": user_id}
+        if endpoint == "detect-ai/batch":
+            texts = [self.document() for _ in range(self.batch_items)]
+            return endpoint, "POST", "/detect-ai/batch", {"texts": texts, "user_id": user_id}
+        user_id = self.random.choice(self.known_users or self.users)
+        return endpoint, "GET", f"/user-usage/{user_id}", None
+
+    async def client(self, http, deadline: float, record_after: float):
+        loop = asyncio.get_running_loop()
+        while loop.time() < deadline:
+            endpoint, method, path, body = self.request()
+            start = loop.time()
+            try:
+                response = await http.request(method, path, json=body)
+                await response.aread()
+                status = str(response.status_code)
+                if body and response.status_code == 200 and body["user_id"] not in self.known_users:
+                    self.known_users.append(body["user_id"])
+            except Exception as e:
+                status = type(e).__name__
+            finished = loop.time()
+            if start >= record_after:
+                latencies, statuses = self.results.setdefault(endpoint, ([], {}))
+                latencies.append(finished - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    async def run(self, concurrency: int, duration: float, warmup: float):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        record_after = loop.time() + warmup
+        deadline = record_after + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=120) as http:
+            await asyncio.gather(*(self.client(http, deadline, record_after) for _ in range(concurrency)))
+
+    def report(self, duration: float) -> dict:
+        endpoints = {}
+        for endpoint, (latencies, statuses) in sorted(self.results.items()):
+            latencies.sort()
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+                "status_codes": statuses,
+                "throughput_rps": round(len(latencies) / duration, 2),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+            }
+        total = sum(result["requests"] for result in endpoints.values())
+        return {"total_requests": total, "throughput_rps": round(total / duration, 2), "endpoints": endpoints}
+
+
+async def run(args) -> dict:
+    winston_port, app_port = free_port(), free_port()
+    tmpdir = tempfile.mkdtemp(prefix="humanizer-load-")
+
+    # Configuration is read at import time, so set it before importing the app
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'load_test.db')}",
+        "WINSTON_API_URL": f"http://127.0.0.1:{winston_port}/detect",
+        "WINSTON_AI_TOKEN": "load-test",
+        "WINSTON_HTTP2": "false",
+        # Large enough never to be hit, small enough for a 32-bit integer column
+        "DEFAULT_USAGE_LIMIT": str(2 * 10 ** 9),
+        "PAID_TIER_MIN_LIMIT": "0",
+        "SEGMENTER_MODE": "sentencizer",
+        "USAGE_ACCOUNTING": args.usage_accounting,
+        "LEDGER_LOG_PATH": os.path.join(tmpdir, "usage_ledger.log"),
+        "BACKGROUND_MODEL_LOADING": "false",
+        # A few simulated users send far more than a real user would
+        "RATE_LIMIT_ENABLED": "false",
+    })
+    os.environ.pop("PARAPHRASE_CACHE_PATH", None)
+
+    import main
+
+    # Install the stub before startup; the model loader then skips Parrot
+    def load_stub():
+        main.paraphrase_engine = StubParaphraser(args.model_batch_ms, args.model_sentence_ms)
+
+    main.model_status.track("paraphraser", load_stub)
+
+    winston, winston_task = await start_server(fake_winston_app(args.winston_ms), winston_port)
+    server, server_task = await start_server(main.app, app_port)
+    try:
+        generator = LoadGenerator(
+            f"http://127.0.0.1:{app_port}", args.endpoints, args.sizes, args.users,
+            args.batch_items, args.tier, args.seed,
+        )
+        await generator.run(args.concurrency, args.duration, args.warmup)
+        report = generator.report(args.duration)
+    finally:
+        for srv in (server, winston):
+            srv.should_exit = True
+        await asyncio.gather(server_task, winston_task, return_exceptions=True)
+
+    report["config"] = {
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "endpoints": args.endpoints,
+        "sizes": args.sizes,
+        "users": args.users,
+        "batch_items": args.batch_items,
+        "tier": args.tier,
+        "model_batch_ms": args.model_batch_ms,
+        "model_sentence_ms": args.model_sentence_ms,
+        "winston_ms": args.winston_ms,
+        "database": "postgres" if args.database_url else "sqlite",
+        "usage_accounting": args.usage_accounting,
+        "seed": args.seed,
+    }
+    return report
+
+
+def main():
+    endpoint_choices = ("humanize", "humanize/stream", "humanize/batch", "detect-ai", "detect-ai/batch", "user-usage")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (default: 16)")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds (default: 10)")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before (default: 2)")
+    parser.add_argument("--endpoints", type=lambda v: parse_mix(v, endpoint_choices),
+                        default="humanize=5,detect-ai=3,humanize/batch=1,user-usage=1",
+                        help="Endpoint weights (default: humanize=5,detect-ai=3,humanize/batch=1,user-usage=1)")
+    parser.add_argument("--sizes", type=lambda v: parse_mix(v, DOCUMENT_SIZES), default="short=6,medium=3,long=1",
+                        help="Document size weights; short/medium/long = 2/8/30 sentences (default: short=6,medium=3,long=1)")
+    parser.add_argument("--users", type=int, default=50, help="Distinct user ids (default: 50)")
+    parser.add_argument("--batch-items", type=int, default=5, help="Texts per batch request (default: 5)")
+    parser.add_argument("--tier", help="Quality tier sent with humanize requests")
+    parser.add_argument("--model-batch-ms", type=float, default=20, help="Stub model cost per batch (default: 20)")
+    parser.add_argument("--model-sentence-ms", type=float, default=5, help="Stub model cost per sentence (default: 5)")
+    parser.add_argument("--winston-ms", type=float, default=50, help="Fake Winston AI latency (default: 50)")
+    parser.add_argument("--database-url", help="Use this database instead of a temporary SQLite file")
+    parser.add_argument("--usage-accounting", default="direct", choices=("direct", "write_behind"))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    print(f"\n{'endpoint':<18} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, result in report["endpoints"].items():
+        print(
+            f"{endpoint:<18} {result['requests']:>9} {result['errors']:>7} {result['throughput_rps']:>8.1f} "
+            f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f}"
+        )
+    print(f"{'total':<18} {report['total_requests']:>9} {'':>7} {report['throughput_rps']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Measure long-document mode: humanize time of one document by number of worker processes.
+
+Each worker count gets a fresh ParagraphPool (paragraph_pool.py) whose workers
+load the configured paraphrase engine (PARAPHRASE_BACKEND, INFERENCE_BACKEND)
+and use cpu_count // workers torch threads. Model loading and one warm-up
+document are not counted. On an N-core machine the document should take about
+1/N of the single-worker time, as long as it has at least N paragraphs.
+
+Usage:
+  python benchmarks/long_document_benchmark.py
+  python benchmarks/long_document_benchmark.py --document essay.txt --workers 1 2 4 8 --json results.json
+
+A document file separates paragraphs with blank lines.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paragraph_pool import ParagraphPool, split_paragraphs  # noqa: E402
+from quality_tiers import QUALITY_TIERS, get_tier  # noqa: E402
+
+SAMPLE_PARAGRAPH = (
+    "Artificial intelligence has transformed many industries over the last decade. "
+    "Researchers have built systems that translate languages, recognise images and write text. "
+    "However, critics argue that progress is often overstated in the press. "
+    "The answer depends on the benchmark and on how the results are measured."
+)
+
+
+def load_document(path, paragraphs):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    return "\n\n".join([SAMPLE_PARAGRAPH] * paragraphs)
+
+
+async def benchmark_workers(workers, document, tier, repeat):
+    # Same default split of the cores as the server
+    pool = ParagraphPool(workers=workers, torch_threads=0)
+    try:
+        start = time.perf_counter()
+        pool.start()
+        # Warm up every worker with the document itself so model loading is not counted
+        await pool.humanize(document, tier)
+        startup_seconds = time.perf_counter() - start
+
+        timings = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            paragraphs, _ = await pool.humanize(document, tier)
+            timings.append(time.perf_counter() - start)
+        sentences = sum(len(paragraph) for paragraph, _ in paragraphs)
+    finally:
+        pool.shutdown()
+
+    best = min(timings)
+    return {
+        "workers": workers,
+        "torch_threads": pool.torch_threads,
+        "startup_seconds": round(startup_seconds, 2),
+        "seconds": round(best, 3),
+        "sentences_per_second": round(sentences / best, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--document", help="Text file to humanize (default: a generated document)")
+    parser.add_argument("--paragraphs", type=int, default=16, help="Paragraphs in the generated document (default: 16)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--tier", default=None, choices=list(QUALITY_TIERS), help="Quality tier (default: the default tier)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per worker count; the best is reported (default: 3)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    document = load_document(args.document, args.paragraphs)
+    paragraphs, _ = split_paragraphs(document)
+    print(f"Humanizing {len(paragraphs)} paragraphs ({len(document.split())} words)")
+
+    tier = get_tier(args.tier)
+    results = [asyncio.run(benchmark_workers(n, document, tier, args.repeat)) for n in args.workers]
+
+    baseline = results[0]["seconds"]
+    print()
+    print(f"{'workers':>7} {'threads':>8} {'seconds':>9} {'sent/s':>8} {'speedup':>8}")
+    for result in results:
+        result["speedup"] = round(baseline / result["seconds"], 2)
+        print(
+            f"{result['workers']:>7} {result['torch_threads']:>8} {result['seconds']:>9.3f} "
+            f"{result['sentences_per_second']:>8.1f} {result['speedup']:>7.2f}x"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"paragraphs": len(paragraphs), "tier": tier.name, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Compare sentence segmentation modes for speed and accuracy.
+
+Every mode from segmentation.py is loaded and run over the same corpus.
+Accuracy is measured as precision/recall/F1 of sentence boundaries against
+the full en_core_web_sm pipeline (the previous behaviour of /humanize).
+
+Usage:
+  python benchmarks/segmentation_benchmark.py
+  python benchmarks/segmentation_benchmark.py --corpus my_texts.txt --repeat 5 --json results.json
+
+A corpus file holds one document per paragraph (separated by blank lines).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segmentation import SEGMENTER_MODES, load_pipeline  # noqa: E402
+
+SAMPLE_DOCUMENTS = [
+    "Born into a wealthy family in Pretoria, South Africa, Musk emigrated in 1989 to Canada; "
+    "he had obtained Canadian citizenship at birth through his Canadian-born mother. "
+    "He graduated from the University of Pennsylvania in 1997. "
+    "He then moved to California to attend Stanford University, but dropped out after two days.",
+    "Artificial intelligence has transformed many industries. Dr. Smith, a researcher at the U.S. "
+    "National Lab, said the results were \"remarkable.\" However, critics argue that progress is "
+    "overstated! What does the data actually show? The answer depends on the benchmark, e.g. "
+    "reading comprehension vs. arithmetic.",
+    "The meeting starts at 9 a.m. on Monday. Please bring the Q3 report (approx. 40 pages) and "
+    "your laptop. Lunch will be provided by the catering team at 12:30 p.m. sharp.",
+    "In conclusion, the proposed method reduces latency by 35% while keeping accuracy within "
+    "0.5 points of the baseline. Future work will explore larger models. We also plan to release "
+    "the code and data.",
+]
+
+
+def load_corpus(path):
+    if not path:
+        return list(SAMPLE_DOCUMENTS)
+    with open(path, encoding="utf-8") as f:
+        return [doc.strip() for doc in f.read().split("\n\n") if doc.strip()]
+
+
+def boundaries(nlp, texts):
+    """Sentence end offsets (ignoring whitespace-only sentences) for each text"""
+    return [
+        {sent.end_char for sent in doc.sents if sent.text.strip()}
+        for doc in nlp.pipe(texts)
+    ]
+
+
+def score(reference, predicted):
+    true_positives = sum(len(ref & pred) for ref, pred in zip(reference, predicted))
+    predicted_total = sum(len(pred) for pred in predicted)
+    reference_total = sum(len(ref) for ref in reference)
+    precision = true_positives / predicted_total if predicted_total else 0.0
+    recall = true_positives / reference_total if reference_total else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def benchmark_mode(mode, texts, reference):
+    start = time.perf_counter()
+    nlp = load_pipeline(mode)
+    load_seconds = time.perf_counter() - start
+
+    # Warm up so lazy initialisation is not counted
+    list(nlp.pipe(texts[:4]))
+
+    start = time.perf_counter()
+    for text in texts:
+        list(nlp(text).sents)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for doc in nlp.pipe(texts, batch_size=32):
+        list(doc.sents)
+    pipe_seconds = time.perf_counter() - start
+
+    precision, recall, f1 = score(reference, boundaries(nlp, texts))
+    chars = sum(len(text) for text in texts)
+    return {
+        "mode": mode,
+        "components": list(nlp.pipe_names),
+        "load_seconds": round(load_seconds, 3),
+        "docs_per_second": round(len(texts) / single_seconds, 1),
+        "docs_per_second_pipe": round(len(texts) / pipe_seconds, 1),
+        "chars_per_second_pipe": round(chars / pipe_seconds),
+        "boundary_precision": round(precision, 4),
+        "boundary_recall": round(recall, 4),
+        "boundary_f1": round(f1, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Text file with documents separated by blank lines")
+    parser.add_argument("--repeat", type=int, default=50, help="Times to repeat the corpus (default: 50)")
+    parser.add_argument("--modes", nargs="+", default=list(SEGMENTER_MODES), choices=SEGMENTER_MODES)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus) * max(1, args.repeat)
+    print(f"Segmenting {len(texts)} documents ({sum(len(t) for t in texts)} characters)")
+
+    reference = boundaries(load_pipeline("full"), texts)
+    results = [benchmark_mode(mode, texts, reference) for mode in args.modes]
+
+    print()
+    print(f"{'mode':<12} {'load s':>7} {'docs/s':>9} {'docs/s pipe':>12} {'F1 vs full':>11}")
+    for result in results:
+        print(
+            f"{result['mode']:<12} {result['load_seconds']:>7.2f} {result['docs_per_second']:>9.1f} "
+            f"{result['docs_per_second_pipe']:>12.1f} {result['boundary_f1']:>11.4f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"documents": len(texts), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
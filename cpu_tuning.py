@@ -0,0 +1,235 @@
+"""
+Torch threading and CPU affinity for inference workers.
+
+By default every process uses one torch intra-op thread per core. With several
+gunicorn workers on one node, N workers x all cores threads fight over the same
+cores and throughput collapses. Each worker can instead be given:
+- CPU_AFFINITY: the cores it may run on. "auto" splits the cores available to
+  the server evenly between WEB_CONCURRENCY workers; a list such as "0-3,8"
+  pins every worker to those cores; empty (default) leaves scheduling to the OS
+- TORCH_INTRA_OP_THREADS: "auto" (default) is the worker's pinned core count,
+  or its share of all cores when not pinned, divided by the engine calls the
+  worker runs at once; a number sets it explicitly
+- TORCH_INTEROP_THREADS: torch inter-op pool size (0 keeps torch's default)
+- THREAD_CALIBRATION: after warm-up, time the engine with each thread count in
+  THREAD_CALIBRATION_CANDIDATES and keep the fastest (sentences per second)
+
+A worker runs up to inference_concurrency() engine calls at once (inference
+pool threads, capped by the batcher's BATCH_MAX_IN_FLIGHT), each using the full
+intra-op thread count. "auto" therefore gives each call its share of the
+worker's cores, and calibration runs that many calls side by side.
+
+torch keeps the intra-op thread count per OS thread, so setting it once does not
+reach inference pool threads that already exist. Each engine call on the pool
+therefore first applies the current count to its own thread
+(apply_torch_threads), which is how a calibrated count reaches every thread.
+
+The settings apply to the torch and int8 inference backends. The chosen values
+are reported by /ready and /metrics.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+from metrics import CALIBRATION_THROUGHPUT, PINNED_CPUS, TORCH_THREADS
+
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "").strip().lower()
+TORCH_INTRA_OP_THREADS = os.getenv("TORCH_INTRA_OP_THREADS", "auto").strip().lower()
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", 0))
+THREAD_CALIBRATION = os.getenv("THREAD_CALIBRATION", "false").lower() in ("1", "true", "yes")
+THREAD_CALIBRATION_CANDIDATES = [
+    int(n) for n in os.getenv("THREAD_CALIBRATION_CANDIDATES", "1,2,4,8").split(",") if n.strip()
+]
+THREAD_CALIBRATION_ROUNDS = int(os.getenv("THREAD_CALIBRATION_ROUNDS", 2))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """Parse a CPU list such as "0-3,8" into [0, 1, 2, 3, 8]"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_share(cpus: Sequence[int], slot: int, workers: int) -> List[int]:
+    """The slot-th of `workers` contiguous, near-equal shares of cpus (at least one core each)"""
+    workers = max(1, workers)
+    if workers >= len(cpus):
+        return [cpus[slot % len(cpus)]]
+    start = len(cpus) * slot // workers
+    end = len(cpus) * (slot + 1) // workers
+    return list(cpus[start:end])
+
+
+class CpuSettings:
+    """Affinity and torch thread settings of this process, as applied"""
+
+    def __init__(self):
+        self.slot = None
+        self.workers = 1
+        self.pinned_cpus = None
+        self.intra_op_threads = None
+        self.interop_threads = None
+        self.source = None  # "config", "auto" or "calibrated"
+        self.concurrency = None
+        self.calibration: Dict[int, float] = {}
+
+    def stats(self) -> dict:
+        return {
+            "worker_slot": self.slot,
+            "workers": self.workers,
+            "pinned_cpus": self.pinned_cpus,
+            "intra_op_threads": self.intra_op_threads,
+            "interop_threads": self.interop_threads,
+            "threads_source": self.source,
+            "concurrent_inference_calls": self.concurrency,
+            "calibration_sentences_per_second": {str(n): sps for n, sps in self.calibration.items()} or None,
+        }
+
+
+cpu_settings = CpuSettings()
+# Intra-op thread count last applied on each thread
+_applied = threading.local()
+
+TORCH_THREADS.set_callback(lambda: {
+    key: value for key, value in (
+        (("intra_op",), cpu_settings.intra_op_threads),
+        (("interop",), cpu_settings.interop_threads),
+    ) if value is not None
+})
+PINNED_CPUS.set_callback(lambda: {(): len(cpu_settings.pinned_cpus)} if cpu_settings.pinned_cpus else {})
+CALIBRATION_THROUGHPUT.set_callback(lambda: {(str(n),): sps for n, sps in cpu_settings.calibration.items()})
+
+
+def configure_worker(slot: int = 0, workers: int = 1):
+    """
+    Pin this process per CPU_AFFINITY, as worker `slot` of `workers` sharing the node.
+    Only the first call has an effect, so gunicorn's post_fork takes precedence over app startup.
+    """
+    if cpu_settings.slot is not None:
+        return
+    cpu_settings.slot = slot
+    cpu_settings.workers = max(1, workers)
+
+    if not CPU_AFFINITY or not hasattr(os, "sched_setaffinity"):
+        return
+    if CPU_AFFINITY == "auto":
+        cpus = cpu_share(available_cpus(), slot, workers)
+    else:
+        cpus = parse_cpu_list(CPU_AFFINITY)
+    os.sched_setaffinity(0, cpus)
+    cpu_settings.pinned_cpus = cpus
+
+
+def inference_concurrency() -> int:
+    """Engine calls a worker runs at once: inference pool threads, capped by the batcher's in-flight limit"""
+    from backends import PARAPHRASE_BATCHING
+    from batch_scheduler import BATCH_MAX_IN_FLIGHT
+    from inference_pool import INFERENCE_WORKERS
+
+    calls = INFERENCE_WORKERS
+    if PARAPHRASE_BATCHING and BATCH_MAX_IN_FLIGHT > 0:
+        calls = min(calls, BATCH_MAX_IN_FLIGHT)
+    return max(1, calls)
+
+
+def worker_cores() -> int:
+    """Cores this worker may use: its pinned cores, or its share of all cores when not pinned"""
+    if cpu_settings.pinned_cpus:
+        return len(cpu_settings.pinned_cpus)
+    return max(1, len(available_cpus()) // cpu_settings.workers)
+
+
+def default_intra_op_threads() -> int:
+    """TORCH_INTRA_OP_THREADS, or for "auto" each concurrent engine call's share of the worker's cores"""
+    if TORCH_INTRA_OP_THREADS != "auto":
+        return max(1, int(TORCH_INTRA_OP_THREADS))
+    return max(1, worker_cores() // inference_concurrency())
+
+
+def configure_torch(threads: int = None, source: str = None):
+    """Apply torch thread settings (imports torch; call where torch is about to be used)"""
+    import torch
+
+    if threads is None:
+        threads = default_intra_op_threads()
+        source = "auto" if TORCH_INTRA_OP_THREADS == "auto" else "config"
+    torch.set_num_threads(threads)
+    _applied.threads = threads
+    cpu_settings.intra_op_threads = threads
+    cpu_settings.source = source
+    cpu_settings.concurrency = inference_concurrency()
+
+    if TORCH_INTEROP_THREADS and cpu_settings.interop_threads is None:
+        try:
+            torch.set_interop_threads(TORCH_INTEROP_THREADS)
+        except RuntimeError:
+            # Only settable once, before any inter-op work (e.g. already set in the preloading master)
+            pass
+    cpu_settings.interop_threads = torch.get_num_interop_threads()
+
+
+def apply_torch_threads():
+    """Give the calling thread the configured intra-op thread count, if torch is configured and it differs"""
+    threads = cpu_settings.intra_op_threads
+    if threads is None or getattr(_applied, "threads", None) == threads:
+        return
+    import torch
+
+    torch.set_num_threads(threads)
+    _applied.threads = threads
+
+
+def calibrate_threads(run: Callable[[], None], sentences: int, concurrency: int = None,
+                      candidates: Sequence[int] = THREAD_CALIBRATION_CANDIDATES,
+                      rounds: int = THREAD_CALIBRATION_ROUNDS) -> int:
+    """
+    Time run() (which paraphrases `sentences` sentences) at each candidate thread count
+    and keep the one with the best total throughput. Each round runs `concurrency` calls
+    side by side (default: inference_concurrency()), as the server does under load.
+    Candidates above the worker's share of the cores are skipped.
+    """
+    import torch
+
+    concurrency = max(1, concurrency or inference_concurrency())
+    candidates = sorted({n for n in candidates if 0 < n <= worker_cores()}) or [default_intra_op_threads()]
+    rounds = max(1, rounds)
+
+    def run_with(threads):
+        # Set on the pool thread itself; the count does not carry over from the calling thread
+        torch.set_num_threads(threads)
+        _applied.threads = threads
+        run()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="calibration") as pool:
+        def run_round(threads):
+            for future in [pool.submit(run_with, threads) for _ in range(concurrency)]:
+                future.result()
+
+        for threads in candidates:
+            run_round(threads)  # warm-up at this thread count
+            start = time.perf_counter()
+            for _ in range(rounds):
+                run_round(threads)
+            cpu_settings.calibration[threads] = round(
+                sentences * rounds * concurrency / (time.perf_counter() - start), 2
+            )
+
+    best = max(cpu_settings.calibration, key=cpu_settings.calibration.get)
+    configure_torch(best, source="calibrated")
+    return best
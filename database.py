@@ -30,6 +30,13 @@ class UserUsage(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+class UsageLedgerSegment(Base):
+    """Usage ledger log segments already applied to user_usage (write-behind mode)"""
+    __tablename__ = "usage_ledger_segments"
+    
+    segment = Column(String, primary_key=True)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
 # Create engine
 if DATABASE_URL:
     # Remove sslmode parameter if present (asyncpg doesn't support it)
@@ -39,13 +46,17 @@ if DATABASE_URL:
         base_url = DATABASE_URL.split('?')[0]
         DATABASE_URL = base_url
     
-    engine = create_async_engine(
-        DATABASE_URL, 
-        echo=False,
-        pool_pre_ping=True,  # Verify connections before using them
-        pool_recycle=3600,   # Recycle connections after 1 hour
-        max_overflow=20      # Allow more connections in pool
-    )
+    if DATABASE_URL.startswith("sqlite"):
+        # SQLite (e.g. sqlite+aiosqlite:///./humanizer.db) for local testing
+        engine = create_async_engine(DATABASE_URL, echo=False)
+    else:
+        engine = create_async_engine(
+            DATABASE_URL, 
+            echo=False,
+            pool_pre_ping=True,  # Verify connections before using them
+            pool_recycle=3600,   # Recycle connections after 1 hour
+            max_overflow=20      # Allow more connections in pool
+        )
     AsyncSessionLocal = async_sessionmaker(
         engine, class_=AsyncSession, expire_on_commit=False
     )
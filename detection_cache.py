@@ -0,0 +1,89 @@
+"""
+Content-addressed cache for AI detection results.
+
+The same text is usually checked several times (before humanizing, after
+humanizing, on resubmission), and each check is a paid, slow Winston AI call.
+Successful responses are stored under a SHA-256 hash of the exact text for
+DETECTION_CACHE_TTL seconds. Concurrent checks of identical text share a single
+in-flight upstream call (single-flight) instead of each making their own.
+"""
+import asyncio
+import copy
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+DETECTION_CACHE_TTL = float(os.getenv("DETECTION_CACHE_TTL", 3600))
+DETECTION_CACHE_SIZE = int(os.getenv("DETECTION_CACHE_SIZE", 5000))
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DetectionCache:
+    """TTL + LRU cache of detection results with single-flight fetching"""
+
+    def __init__(self, ttl: float = DETECTION_CACHE_TTL, max_entries: int = DETECTION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_fetch(self, text: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Return the cached result for text, or call fetch() to get it.
+        Callers always receive their own copy, so they can add fields to it.
+        """
+        key = text_key(text)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(result)
+            del self._entries[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Run the upstream call as its own task so a disconnecting caller
+            # does not cancel it for everyone else waiting on the same text
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or self.max_entries == 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0,
+        }
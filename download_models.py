@@ -1,10 +1,20 @@
 """
 Pre-download models before starting the server
 Run this first, then start the server
+
+  python download_models.py                 # download the PyTorch models
+  python download_models.py --onnx          # also export int8 ONNX models (INFERENCE_BACKEND=onnx)
+  python download_models.py --onnx --no-quantize   # export fp32 ONNX models
 """
+import argparse
 import warnings
 warnings.filterwarnings("ignore")
 
+parser = argparse.ArgumentParser(description="Download (and optionally optimize) the models")
+parser.add_argument("--onnx", action="store_true", help="Export ONNX Runtime models to OPTIMIZED_MODEL_DIR")
+parser.add_argument("--no-quantize", action="store_true", help="Keep exported ONNX models in fp32")
+args = parser.parse_args()
+
 print("=" * 60)
 print("Downloading Models for Text Humanizer API")
 print("=" * 60)
@@ -20,6 +30,12 @@ import spacy
 nlp = spacy.load("en_core_web_sm")
 print("✅ spaCy model downloaded successfully!")
 
+if args.onnx:
+    print("\n📦 Exporting ONNX Runtime models...")
+    from inference_backends import export_onnx, OPTIMIZED_MODEL_DIR
+    export_onnx(OPTIMIZED_MODEL_DIR, quantize=not args.no_quantize)
+    print(f"✅ ONNX models saved to {OPTIMIZED_MODEL_DIR}/ (start with INFERENCE_BACKEND=onnx)")
+
 print("\n🎉 All models are ready!")
 print("You can now start the server with:")
 print("  uvicorn main:app --host 0.0.0.0 --port 8000")
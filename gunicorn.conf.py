@@ -0,0 +1,72 @@
+"""
+Gunicorn config for running several uvicorn workers on one node.
+
+  gunicorn main:app -c gunicorn.conf.py
+
+With PRELOAD_MODELS on (default), the app is imported and Parrot/spaCy are
+loaded once in the master process; workers are then forked and share those
+pages copy-on-write instead of each loading its own multi-GB copy. The garbage
+collector is frozen before forking, otherwise collections in each worker would
+write to every object header and un-share the pages.
+
+No inference runs in the master: thread pools started before fork (PyTorch's
+OpenMP pool, ONNX Runtime sessions) do not survive into the children. For that
+reason the onnx backend is always loaded per worker.
+
+Each worker gets a stable slot (0..workers-1) that is reused when a worker is
+replaced; with CPU_AFFINITY=auto the slot selects the worker's share of the
+cores, and torch threads are sized to it (see cpu_tuning.py).
+"""
+import gc
+import os
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() in ("1", "true", "yes")
+preload_app = PRELOAD_MODELS
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported, before any worker is forked"""
+    if not PRELOAD_MODELS:
+        return
+
+    import main
+    from inference_backends import INFERENCE_BACKEND
+
+    if INFERENCE_BACKEND == "onnx":
+        server.log.info("INFERENCE_BACKEND=onnx: models are loaded in each worker")
+        return
+
+    # Keep the collector from running while the models are built
+    gc.disable()
+    main.load_models()
+    gc.collect()
+    gc.freeze()
+    server.log.info("Models preloaded in master; %d objects frozen for sharing", gc.get_freeze_count())
+
+
+def pre_fork(server, worker):
+    """Runs in the master: give the new worker the lowest slot no live worker holds"""
+    taken = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(server.num_workers + len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    # The master left the collector disabled; frozen objects stay out of collections
+    gc.enable()
+
+    import cpu_tuning
+
+    cpu_tuning.configure_worker(worker.cpu_slot, server.num_workers)
+    # Preloaded torch models were set up for the whole node in the master; resize to this worker's share
+    main = sys.modules.get("main")
+    if main is not None and main.USES_TORCH and main.paraphrase_engine is not None:
+        cpu_tuning.configure_torch()
+    server.log.info("Worker %s: slot %d, cpus %s, torch threads %s", worker.pid, worker.cpu_slot,
+                    cpu_tuning.cpu_settings.pinned_cpus or "all", cpu_tuning.cpu_settings.intra_op_threads)
@@ -0,0 +1,146 @@
+"""
+CPU inference backends for the Parrot models.
+
+INFERENCE_BACKEND selects how the paraphraser and its adequacy/fluency scorers run:
+- torch: the fp32 PyTorch models as downloaded (default)
+- int8:  PyTorch with dynamic int8 quantization of every Linear layer; applied
+         at load time, no extra artifacts needed
+- onnx:  ONNX Runtime graphs exported by `python download_models.py --onnx`
+         into OPTIMIZED_MODEL_DIR (int8-quantized unless exported with --no-quantize)
+
+Every backend returns an object with the attributes BatchParaphraser uses from
+Parrot (tokenizer, model, adequacy_score, fluency_score, diversity_score), so the
+batching, filtering and ranking code is shared.
+
+The onnx backend needs `pip install optimum[onnxruntime]`.
+"""
+import gc
+import os
+from types import SimpleNamespace
+
+from paraphrase_engine import PARROT_MODEL_TAG
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+OPTIMIZED_MODEL_DIR = os.getenv("OPTIMIZED_MODEL_DIR", "optimized_models")
+
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+
+ADEQUACY_MODEL_TAG = "prithivida/parrot_adequacy_model"
+FLUENCY_MODEL_TAG = "prithivida/parrot_fluency_model"
+
+# Sub-directories of OPTIMIZED_MODEL_DIR for each exported model
+_ONNX_MODELS = {
+    "paraphraser": PARROT_MODEL_TAG,
+    "adequacy": ADEQUACY_MODEL_TAG,
+    "fluency": FLUENCY_MODEL_TAG,
+}
+
+
+class LevenshteinRanker:
+    """
+    Parrot's levenshtein diversity ranking without loading its sentence
+    transformer, which is only needed for the (unused) euclidean ranker
+    """
+
+    def rank(self, input_phrase, para_phrases, diversity_ranker="levenshtein"):
+        import Levenshtein
+
+        return {
+            para_phrase: Levenshtein.distance(input_phrase.lower(), para_phrase)
+            for para_phrase in para_phrases
+        }
+
+
+def load_parrot(backend: str = INFERENCE_BACKEND, model_dir: str = OPTIMIZED_MODEL_DIR):
+    """Load the Parrot models for the given backend"""
+    if backend == "torch":
+        from parrot import Parrot
+
+        return Parrot(model_tag=PARROT_MODEL_TAG, use_gpu=False)
+    if backend == "int8":
+        from parrot import Parrot
+
+        return quantize_int8(Parrot(model_tag=PARROT_MODEL_TAG, use_gpu=False))
+    if backend == "onnx":
+        return load_onnx(model_dir)
+    raise ValueError(f"Unknown INFERENCE_BACKEND {backend!r}, expected one of {', '.join(INFERENCE_BACKENDS)}")
+
+
+def quantize_int8(parrot):
+    """Replace the paraphraser and scorer models with dynamically quantized int8 copies"""
+    import torch
+
+    def quantize(model):
+        return torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+    parrot.model = quantize(parrot.model)
+    parrot.adequacy_score.adequacy_model = quantize(parrot.adequacy_score.adequacy_model)
+    parrot.fluency_score.fluency_model = quantize(parrot.fluency_score.fluency_model)
+    # Release the fp32 weights
+    gc.collect()
+    return parrot
+
+
+def load_onnx(model_dir: str = OPTIMIZED_MODEL_DIR):
+    """Load the exported ONNX Runtime models without loading any PyTorch weights"""
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTModelForSequenceClassification
+    except ImportError:
+        raise RuntimeError("INFERENCE_BACKEND=onnx requires `pip install optimum[onnxruntime]`")
+    from transformers import AutoTokenizer
+
+    paths = {name: os.path.join(model_dir, name) for name in _ONNX_MODELS}
+    missing = [path for path in paths.values() if not os.path.isdir(path)]
+    if missing:
+        raise RuntimeError(
+            f"ONNX models not found in {', '.join(missing)}; run `python download_models.py --onnx` first"
+        )
+
+    return SimpleNamespace(
+        tokenizer=AutoTokenizer.from_pretrained(paths["paraphraser"]),
+        model=ORTModelForSeq2SeqLM.from_pretrained(paths["paraphraser"]),
+        adequacy_score=SimpleNamespace(
+            tokenizer=AutoTokenizer.from_pretrained(paths["adequacy"]),
+            adequacy_model=ORTModelForSequenceClassification.from_pretrained(paths["adequacy"]),
+        ),
+        fluency_score=SimpleNamespace(
+            fluency_tokenizer=AutoTokenizer.from_pretrained(paths["fluency"]),
+            fluency_model=ORTModelForSequenceClassification.from_pretrained(paths["fluency"]),
+        ),
+        diversity_score=LevenshteinRanker(),
+    )
+
+
+def export_onnx(model_dir: str = OPTIMIZED_MODEL_DIR, quantize: bool = True):
+    """
+    Export the paraphraser and scorer models to ONNX in model_dir and, unless
+    quantize is False, replace them with dynamically quantized int8 graphs
+    """
+    from optimum.onnxruntime import (
+        ORTModelForSeq2SeqLM,
+        ORTModelForSequenceClassification,
+        ORTQuantizer,
+    )
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    for name, model_tag in _ONNX_MODELS.items():
+        path = os.path.join(model_dir, name)
+        model_class = ORTModelForSeq2SeqLM if name == "paraphraser" else ORTModelForSequenceClassification
+        print(f"Exporting {model_tag} to {path}...")
+        model = model_class.from_pretrained(model_tag, export=True)
+        model.save_pretrained(path)
+        AutoTokenizer.from_pretrained(model_tag).save_pretrained(path)
+
+        if quantize:
+            config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            for onnx_file in sorted(f for f in os.listdir(path) if f.endswith(".onnx")):
+                quantizer = ORTQuantizer.from_pretrained(path, file_name=onnx_file)
+                quantizer.quantize(save_dir=path, quantization_config=config)
+                # Keep the original file names so from_pretrained() picks up the int8 graphs
+                os.replace(
+                    os.path.join(path, onnx_file.replace(".onnx", "_quantized.onnx")),
+                    os.path.join(path, onnx_file),
+                )
+        del model
+        gc.collect()
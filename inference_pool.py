@@ -0,0 +1,64 @@
+"""
+Dedicated worker pool for model inference.
+
+spaCy parsing and Parrot generation are CPU-bound and synchronous. Running them
+directly inside an async handler blocks the event loop, so every other request
+(/health, /user-usage, ...) waits behind a long humanize call. Handlers await
+InferenceExecutor.run() instead, which runs the work on a thread pool (PyTorch
+releases the GIL inside its kernels) and keeps the number of queued jobs bounded.
+Every job first applies the current torch thread count to its pool thread (see
+cpu_tuning.py).
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cpu_tuning import apply_torch_threads
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", os.cpu_count() or 1))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 32))
+
+
+def _call(fn, *args, **kwargs):
+    apply_torch_threads()
+    return fn(*args, **kwargs)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when all workers are busy and the wait queue is full"""
+
+
+class InferenceExecutor:
+    """Thread pool with a bounded number of running + waiting jobs"""
+
+    def __init__(self, max_workers: int = INFERENCE_WORKERS, max_queue: int = INFERENCE_QUEUE_SIZE):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._in_flight = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        if self._in_flight >= self.max_workers + self.max_queue:
+            raise InferenceQueueFull(
+                f"Inference queue is full ({self._in_flight} jobs running or waiting)"
+            )
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(_call, fn, *args, **kwargs))
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "queue_size": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - self.max_workers),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
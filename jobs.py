@@ -0,0 +1,147 @@
+"""
+Background jobs for large-document humanization.
+
+POST /humanize/jobs puts a job on a bounded work queue and returns its id right
+away; a fixed number of worker tasks (HUMANIZE_JOB_CONCURRENCY) take jobs off
+the queue and run them. Progress and results are kept by a JobBackend. The
+default InMemoryJobBackend is in-process; other backends (e.g. a shared store)
+only need to implement the same four methods.
+"""
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+HUMANIZE_JOB_CONCURRENCY = int(os.getenv("HUMANIZE_JOB_CONCURRENCY", 2))
+HUMANIZE_JOB_QUEUE_SIZE = int(os.getenv("HUMANIZE_JOB_QUEUE_SIZE", 100))
+HUMANIZE_JOB_TTL = float(os.getenv("HUMANIZE_JOB_TTL", 3600))
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue cannot take more work"""
+
+
+@dataclass
+class Job:
+    user_id: str
+    text: str
+    tier: Optional[str] = None
+    # Usage right after the job's credits were held at submit ({"token_usage", "usage_limit"})
+    usage: Optional[dict] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued, running, completed, failed
+    sentences_done: int = 0
+    sentences_total: Optional[int] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+
+class JobBackend:
+    """Storage and queue for jobs"""
+
+    async def submit(self, job: Job):
+        """Store a new job and queue it; raise JobQueueFull if there is no room"""
+        raise NotImplementedError
+
+    async def next(self) -> Job:
+        """Wait for the next queued job"""
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    async def save(self, job: Job):
+        """Persist progress/status changes of a job"""
+        raise NotImplementedError
+
+
+class InMemoryJobBackend(JobBackend):
+    """In-process queue and job table; finished jobs expire after ttl seconds"""
+
+    def __init__(self, max_queue: int = HUMANIZE_JOB_QUEUE_SIZE, ttl: float = HUMANIZE_JOB_TTL):
+        self.ttl = ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self._jobs: Dict[str, Job] = {}
+
+    async def submit(self, job: Job):
+        self._expire()
+        try:
+            self._queue.put_nowait(job.id)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self._queue.qsize()} jobs waiting)")
+        self._jobs[job.id] = job
+
+    async def next(self) -> Job:
+        while True:
+            job = self._jobs.get(await self._queue.get())
+            if job is not None:
+                return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def save(self, job: Job):
+        self._jobs[job.id] = job
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "jobs": len(self._jobs)}
+
+
+class JobRunner:
+    """Runs queued jobs with a fixed number of concurrent workers"""
+
+    def __init__(self, backend: JobBackend, handler: Callable[[Job], Awaitable[dict]],
+                 concurrency: int = HUMANIZE_JOB_CONCURRENCY):
+        self.backend = backend
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self._workers = []
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, user_id: str, text: str, tier: Optional[str] = None,
+                     usage: Optional[dict] = None) -> Job:
+        job = Job(user_id=user_id, text=text, tier=tier, usage=usage)
+        await self.backend.submit(job)
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self.backend.next()
+            job.status = "running"
+            await self.backend.save(job)
+            try:
+                job.result = await self.handler(job)
+                job.status = "completed"
+                self.completed += 1
+            except Exception as e:
+                job.error = getattr(e, "detail", None) or str(e)
+                job.status = "failed"
+                self.failed += 1
+            job.finished_at = time.time()
+            await self.backend.save(job)
+
+    def stats(self) -> dict:
+        stats = {"concurrency": self.concurrency, "completed": self.completed, "failed": self.failed}
+        if hasattr(self.backend, "stats"):
+            stats.update(self.backend.stats())
+        return stats
@@ -1,22 +1,54 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
-import requests
-from parrot import Parrot
-import spacy
+import httpx
 import warnings
 import os
+import asyncio
+import json
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 from dotenv import load_dotenv
-from database import get_db, UserUsage, init_db as init_database
+from database import get_db, UserUsage, init_db as init_database, AsyncSessionLocal, engine as db_engine
+from paraphrase_cache import ParaphraseCache, cache_key
+from segmentation import Segmenter
+from inference_pool import InferenceExecutor, InferenceQueueFull
+from admission import AdmissionController, ADMISSION_RETRY_AFTER
+from inference_backends import INFERENCE_BACKEND
+from cpu_tuning import configure_worker, configure_torch, calibrate_threads, cpu_settings, THREAD_CALIBRATION
+from rate_limit import RateLimiter, create_backend as create_rate_limit_backend, plan_for_limit, RATE_LIMIT_ENABLED, RATE_LIMIT_BACKEND
+from paragraph_pool import ParagraphPool, join_paragraphs, LONG_DOCUMENT_WORKERS, LONG_DOCUMENT_MIN_WORDS
+from batch_scheduler import ParaphraseBatcher, BATCH_MAX_SIZE
+from backends import (
+    load_engine, DirectParaphraser, CachedParaphraser, MeteredParaphraser,
+    WinstonDetector, DummyDetector, CachedDetector, DETECTION_BACKENDS,
+    PARAPHRASE_BACKEND, PARAPHRASE_BATCHING, PARAPHRASE_CACHE_ENABLED, DETECTION_BACKEND, DETECTION_CACHE_ENABLED,
+)
+from winston_client import WinstonClient
+from detection_cache import DetectionCache
+from quota import reserve_credits, release_credits, use_ledger, PlanRequired
+from usage_ledger import UsageLedger, USAGE_ACCOUNTING
+from jobs import JobRunner, InMemoryJobBackend, JobQueueFull
+from quality_tiers import QUALITY_TIERS, get_tier, tier_min_limit, tier_metrics
+from readiness import ModelStatus, BACKGROUND_MODEL_LOADING, MODEL_WARMUP
+from metrics import (
+    METRICS_ENABLED, MetricsMiddleware, registry as metrics_registry, db_pool_stats,
+    STAGE_LATENCY, SENTENCES_PER_REQUEST, QUEUE_DEPTH, DB_POOL,
+)
 
 load_dotenv()
 warnings.filterwarnings("ignore")
 
-app = FastAPI(title="Text Humanizer API")
+DUMMY_MODE = PARAPHRASE_BACKEND == "dummy"
+# Thread and calibration settings only apply to engines running on torch
+USES_TORCH = PARAPHRASE_BACKEND == "parrot" and INFERENCE_BACKEND != "onnx"
+
+app = FastAPI(title="Text Humanizer API (Dummy Mode)" if DUMMY_MODE else "Text Humanizer API")
 
 
 # Enable CORS
@@ -28,9 +60,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latency per route for /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Initialize models globally - loaded at startup
-parrot = None
-nlp = None
+segmenter = None
+paraphrase_engine = None
+inference_executor = None
+paraphrase_batcher = None
+paraphrase_cache = None
+paraphraser = None
+paragraph_pool = None
+rate_limiter = None
+winston_client = None
+detector = None
+usage_ledger = None
+job_runner = None
+model_loader = None
+detection_cache = DetectionCache()
+admission = AdmissionController()
+model_status = ModelStatus(
+    "paraphraser", "spacy",
+    *(["warmup"] if MODEL_WARMUP else []),
+    *(["calibration"] if THREAD_CALIBRATION and USES_TORCH else [])
+)
+
+# Text run through the models once after loading, before traffic is accepted
+WARMUP_TEXT = "This sentence warms up the models. It is paraphrased once at startup."
+
+# Maximum number of texts accepted by the batch endpoints
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
 
 # Request/Response models
 class DetectAIRequest(BaseModel):
@@ -40,6 +100,7 @@ class DetectAIRequest(BaseModel):
 class HumanizeRequest(BaseModel):
     text: str
     user_id: str
+    tier: Optional[str] = None  # fast, balanced or best (paid users); default DEFAULT_QUALITY_TIER
 
 class UpdateLimitRequest(BaseModel):
     user_id: str
@@ -85,37 +146,267 @@ class HumanizeResponse(BaseModel):
     total_usage: int
     usage_limit: int
     remaining_usage: int
+    tier: Optional[str] = None
+
+class BatchHumanizeRequest(BaseModel):
+    texts: List[str]
+    user_id: str
+    tier: Optional[str] = None
+
+class BatchDetectAIRequest(BaseModel):
+    texts: List[str]
+    user_id: str
+
+class BatchHumanizeItem(BaseModel):
+    index: int
+    original_text: str
+    humanized_text: Optional[str] = None
+    sentences: List[str] = []
+    humanized_sentences: List[str] = []
+    word_count: int
+    error: Optional[str] = None
+
+class BatchHumanizeResponse(BaseModel):
+    results: List[BatchHumanizeItem]
+    word_count: int
+    total_usage: int
+    usage_limit: int
+    remaining_usage: int
+    tier: Optional[str] = None
+
+class BatchDetectAIItem(BaseModel):
+    index: int
+    word_count: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+class BatchDetectAIResponse(BaseModel):
+    results: List[BatchDetectAIItem]
+    word_count: int
+    total_usage: int
+    usage_limit: int
+    remaining_usage: int
+
+class HumanizeJobResponse(BaseModel):
+    job_id: str
+    status: str
+    sentences_done: int
+    sentences_total: Optional[int] = None
+    result: Optional[HumanizeResponse] = None
+    error: Optional[str] = None
+
+def load_paraphraser():
+    global paraphrase_engine
+    print(f"Loading paraphrase engine (backend: {PARAPHRASE_BACKEND})...")
+    if USES_TORCH:
+        configure_torch()
+        print(f"Torch threads: {cpu_settings.intra_op_threads} intra-op, {cpu_settings.interop_threads} inter-op")
+    paraphrase_engine = load_engine(PARAPHRASE_BACKEND)
+    print("Paraphrase engine loaded")
+
+def load_segmenter():
+    global segmenter
+    print("Loading spaCy model...")
+    segmenter = Segmenter()
+    print(f"spaCy model loaded (segmenter mode: {segmenter.mode})")
+
+def load_models():
+    """
+    Load the paraphrase engine and spaCy into this process unless they are already loaded.
+    gunicorn.conf.py calls this in the master process before forking, so all
+    workers share one copy-on-write copy of the weights.
+    """
+    model_status.track("paraphraser", load_paraphraser)
+    model_status.track("spacy", load_segmenter)
+
+def build_paraphraser():
+    """Stack the configured paraphraser wrappers on the loaded engine (see backends.py)"""
+    global paraphrase_batcher, paraphraser
+    
+    if PARAPHRASE_BATCHING:
+        paraphrase_batcher = ParaphraseBatcher(paraphrase_engine, inference_executor)
+        paraphrase_batcher.start()
+        inner = paraphrase_batcher
+    else:
+        inner = DirectParaphraser(paraphrase_engine, inference_executor)
+    
+    if paraphrase_cache is not None:
+        inner = CachedParaphraser(inner, paraphrase_cache, paraphrase_engine.settings)
+    paraphraser = MeteredParaphraser(inner)
+
+def warm_up_models():
+    """Run one inference so lazy initialisation doesn't land on the first request"""
+    sentences = segmenter.segment(WARMUP_TEXT)
+    paraphrase_engine.paraphrase_batch(sentences, **get_tier().settings)
+
+def calibrate_torch_threads():
+    """Keep the torch thread count with the best measured throughput on the warm-up text"""
+    sentences = segmenter.segment(WARMUP_TEXT)
+    settings = get_tier().settings
+    best = calibrate_threads(lambda: paraphrase_engine.paraphrase_batch(sentences, **settings), len(sentences))
+    print(f"Thread calibration picked {best} torch threads (sentences/sec: {cpu_settings.calibration})")
+
+async def load_models_in_background():
+    """Load both models in parallel off the event loop, then warm them up"""
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(
+            loop.run_in_executor(None, model_status.track, "paraphraser", load_paraphraser),
+            loop.run_in_executor(None, model_status.track, "spacy", load_segmenter),
+        )
+        build_paraphraser()
+        
+        if MODEL_WARMUP:
+            await inference_executor.run(model_status.track, "warmup", warm_up_models)
+        if THREAD_CALIBRATION and USES_TORCH:
+            await inference_executor.run(model_status.track, "calibration", calibrate_torch_threads)
+        print("Models ready")
+    except Exception as e:
+        print(f"Model loading failed: {e}")
+
+def require_models():
+    """Raise a 503 HTTPException until the models are loaded and warmed up"""
+    if not model_status.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Models are still loading, see /ready",
+            headers={"Retry-After": "5"}
+        )
+
+async def check_rate_limit(user_id: str, endpoint: str, cost: int = 1):
+    """Raise a 429 HTTPException if the user's token bucket is empty (no DB access)"""
+    if rate_limiter:
+        await rate_limiter.check(user_id, endpoint, cost)
+
+def remember_usage_limit(user_id: str, usage_limit: int):
+    """Let the rate limiter pick the user's plan from their latest known usage limit"""
+    if rate_limiter:
+        rate_limiter.set_limit(user_id, usage_limit)
+
+def queue_depths():
+    depths = {
+        ("admission_active",): admission.stats()["active"],
+        ("admission_waiting",): admission.stats()["waiting"],
+        ("inference_pool",): inference_executor.stats()["in_flight"],
+        ("jobs",): job_runner.backend.stats()["queued"],
+    }
+    if paraphrase_batcher:
+        depths[("batcher",)] = paraphrase_batcher.stats()["pending"]
+        for priority, pending in paraphrase_batcher.pending_by_priority().items():
+            depths[(f"batcher_{priority}",)] = pending
+    return depths
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    global parrot, nlp
+    global inference_executor, paraphrase_cache, paragraph_pool, rate_limiter, winston_client, detector
+    global usage_ledger, job_runner, model_loader
+    
+    # CPU pinning for a single-process server; gunicorn workers are configured in post_fork
+    configure_worker()
     
     # Initialize database
     await init_database()
     print("Database initialized")
     
-    # Load models at startup
-    print("Loading Parrot model...")
-    parrot = Parrot(model_tag="prithivida/parrot_paraphraser_on_T5", use_gpu=False)
-    print("Parrot model loaded")
+    # Optional write-behind usage accounting
+    if USAGE_ACCOUNTING == "write_behind" and AsyncSessionLocal:
+        usage_ledger = UsageLedger(AsyncSessionLocal)
+        await usage_ledger.start()
+        use_ledger(usage_ledger)
+        print("Write-behind usage ledger started")
     
-    print("Loading spaCy model...")
-    nlp = spacy.load("en_core_web_sm")
-    print("spaCy model loaded")
+    if RATE_LIMIT_ENABLED:
+        rate_limiter = RateLimiter(create_rate_limit_backend())
+        print(f"Per-user rate limiting enabled (backend: {RATE_LIMIT_BACKEND})")
+    
+    if DETECTION_BACKEND == "winston":
+        # Shared HTTP client for Winston AI (keep-alive connection pool)
+        winston_client = WinstonClient()
+        print(f"Winston AI client ready (HTTP/2: {winston_client.http2})")
+        detector = WinstonDetector(winston_client)
+    elif DETECTION_BACKEND == "dummy":
+        detector = DummyDetector()
+    else:
+        raise ValueError(f"Unknown DETECTION_BACKEND {DETECTION_BACKEND!r}, expected one of {', '.join(DETECTION_BACKENDS)}")
+    if DETECTION_CACHE_ENABLED:
+        detector = CachedDetector(detector, detection_cache)
+    print(f"Detection backend: {DETECTION_BACKEND} (cache: {DETECTION_CACHE_ENABLED})")
+    
+    inference_executor = InferenceExecutor()
+    print(f"Inference pool started with {inference_executor.max_workers} workers")
+    
+    # The paraphraser is built on the engine once the models are loaded
+    paraphrase_cache = ParaphraseCache() if PARAPHRASE_CACHE_ENABLED else None
     
-    print("Application ready!")
+    # Optional long-document mode; each worker process loads its own models
+    if LONG_DOCUMENT_WORKERS > 0:
+        paragraph_pool = ParagraphPool()
+        paragraph_pool.start()
+        print(f"Long-document pool started with {paragraph_pool.workers} processes "
+              f"({paragraph_pool.torch_threads} torch threads each)")
+    if DUMMY_MODE:
+        print("⚠️  DUMMY MODE: Using mock responses (no models loaded)")
+    
+    job_runner = JobRunner(InMemoryJobBackend(), run_humanize_job)
+    job_runner.start()
+    print(f"Humanize job runner started with {job_runner.concurrency} workers")
+    
+    # Queue depths and DB pool usage are read when /metrics is scraped
+    QUEUE_DEPTH.set_callback(queue_depths)
+    if db_engine is not None:
+        DB_POOL.set_callback(lambda: db_pool_stats(db_engine))
+    
+    # Models load in the background (already loaded when preloaded before forking workers);
+    # /ready reports when they can take traffic
+    if BACKGROUND_MODEL_LOADING:
+        model_loader = asyncio.create_task(load_models_in_background())
+        print("Application started, loading models in the background")
+    else:
+        await load_models_in_background()
+        print("Application ready!")
+
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    if model_loader:
+        model_loader.cancel()
+    if job_runner:
+        await job_runner.stop()
+    if winston_client:
+        await winston_client.close()
+    if rate_limiter:
+        await rate_limiter.backend.close()
+    if paraphrase_batcher:
+        await paraphrase_batcher.stop()
+    if inference_executor:
+        inference_executor.shutdown()
+    if paragraph_pool:
+        paragraph_pool.shutdown()
+    if paraphrase_cache:
+        paraphrase_cache.close()
+    if usage_ledger:
+        await usage_ledger.stop()
 
 @app.get("/")
 async def root():
     return {
-        "message": "Text Humanizer API",
+        "message": "Text Humanizer API (Dummy Mode)" if DUMMY_MODE else "Text Humanizer API",
+        "backends": {"paraphrase": PARAPHRASE_BACKEND, "detection": DETECTION_BACKEND},
         "endpoints": {
             "/detect-ai": "POST - Detect AI-generated content",
             "/humanize": "POST - Humanize text with usage tracking",
+            "/humanize/stream": "POST - Humanize text, streaming sentences as NDJSON",
+            "/humanize/jobs": "POST - Queue a large document for humanization",
+            "/humanize/batch": "POST - Humanize a list of texts for one user",
+            "/detect-ai/batch": "POST - Detect AI-generated content in a list of texts",
+            "/humanize/jobs/{job_id}": "GET - Get progress and result of a humanize job",
             "/update-limit": "POST - Update user usage limits (admin only)",
             "/user-usage/{user_id}": "GET - Get user usage statistics",
-            "/health": "GET - Health check"
+            "/stats": "GET - Inference pool, batching and cache statistics",
+            "/health": "GET - Health check",
+            "/ready": "GET - Readiness check (models loaded and warmed up)",
+            "/metrics": "GET - Prometheus metrics"
         }
     }
 
@@ -126,162 +417,187 @@ async def detect_ai(request: DetectAIRequest, db: AsyncSession = Depends(get_db)
     Tracks usage per user.
     """
     try:
-        # Get Winston AI token from environment
-        winston_token = os.getenv("WINSTON_AI_TOKEN")
-        if not winston_token:
-            raise HTTPException(status_code=500, detail="WINSTON_AI_TOKEN not found in environment variables")
+        await check_rate_limit(request.user_id, "detect-ai")
         
-        # Get or create user
-        user = await get_or_create_user(db, request.user_id)
+        # Fail before debiting if the detector is not configured (e.g. no Winston AI token)
+        detector.check_config()
         
         # Calculate word count for usage tracking
         word_count = len(request.text.split())
         token_count = word_count  # Using word count as token approximation
         
-        # Check if user has exceeded usage limit
-        if user.token_usage >= user.usage_limit:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Usage limit exceeded. Current usage: {user.token_usage}/{user.usage_limit}"
-            )
-        
-        # Check if this request would exceed the limit
-        if user.token_usage + token_count > user.usage_limit:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Request would exceed usage limit. Current usage: {user.token_usage}/{user.usage_limit}"
-            )
-        
-        url = "https://api.gowinston.ai/v2/ai-content-detection"
-        
-        payload = {
-            "text": request.text,
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {winston_token}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
+        # Check the limit and debit usage in one atomic statement
+        with STAGE_LATENCY.time("detect-ai", "quota"):
+            usage = await reserve_credits(db, request.user_id, token_count, word_count)
+        remember_usage_limit(request.user_id, usage.usage_limit)
         
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Winston AI API error: {response.text}"
-            )
-        
-        # Update user usage
-        user.word_count += word_count
-        user.token_usage += token_count
-        await db.commit()
-        await db.refresh(user)
-        
-        result = response.json()
+        try:
+            with STAGE_LATENCY.time("detect-ai", "winston"):
+                result = await detector.detect(request.text)
+        except Exception:
+            # Give the reserved credits back if detection fails
+            await release_credits(db, request.user_id, token_count, word_count)
+            raise
         
         # Add usage info to response
         result['usage_info'] = {
             'word_count': word_count,
-            'total_usage': user.token_usage,
-            'usage_limit': user.usage_limit,
-            'remaining_usage': user.usage_limit - user.token_usage
+            'total_usage': usage.token_usage,
+            'usage_limit': usage.usage_limit,
+            'remaining_usage': usage.usage_limit - usage.token_usage
         }
         
         return result
         
     except HTTPException:
         raise
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error calling Winston AI: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-async def get_or_create_user(db: AsyncSession, user_id: str):
-    """Get user or create if doesn't exist"""
-    result = await db.execute(select(UserUsage).where(UserUsage.user_id == user_id))
-    user = result.scalar_one_or_none()
+def segment_text(text: str):
+    """Split text into sentences using spaCy (runs on the inference pool)"""
+    return segmenter.segment(text)
+
+def segment_texts(texts: List[str]):
+    """Split several texts into sentences in one inference-pool job; failures are returned per text"""
+    try:
+        return segmenter.segment_many(texts)
+    except Exception:
+        # Fall back to one text at a time to find the ones that fail
+        results = []
+        for text in texts:
+            try:
+                results.append(segmenter.segment(text))
+            except Exception as e:
+                results.append(e)
+        return results
+
+def pick_paraphrase(sentence: str, paraphrases) -> str:
+    """Choose and format the best paraphrase of a sentence"""
+    if not paraphrases:
+        # If no paraphrase available, use original sentence
+        return sentence
     
-    if not user:
-        # Create new user with default limit
-        default_limit = int(os.getenv("DEFAULT_USAGE_LIMIT", 400))
-        user = UserUsage(user_id=user_id, usage_limit=default_limit)
-        db.add(user)
-        await db.commit()
-        await db.refresh(user)
-    return user
+    # Get the paraphrase with the highest score
+    # paraphrases is a list of tuples: (text, score)
+    best_paraphrase = max(paraphrases, key=lambda x: x[1])[0]  # Get text with max score
+    
+    # Clean up and format the paraphrased text
+    # Remove extra whitespace
+    best_paraphrase = " ".join(best_paraphrase.split())
+    
+    # Capitalize first letter
+    best_paraphrase = best_paraphrase[0].upper() + best_paraphrase[1:] if best_paraphrase else best_paraphrase
+    
+    # Add period if sentence doesn't end with punctuation
+    if best_paraphrase and not best_paraphrase.rstrip()[-1] in '.!?':
+        best_paraphrase += "."
+    
+    return best_paraphrase
+
+def resolve_tier(name: Optional[str]):
+    """Look up a requested quality tier, raising a 400 HTTPException if it is unknown"""
+    try:
+        return get_tier(name)
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown tier '{name}', expected one of: {', '.join(QUALITY_TIERS)}"
+        )
+
+async def reserve_for_tier(db: AsyncSession, user_id: str, tokens: int, words: int, tier):
+    """Reserve credits if the user may use the tier (paid tiers need a raised limit), checked in the same statement"""
+    try:
+        usage = await reserve_credits(db, user_id, tokens, words, min_limit=tier_min_limit(tier))
+    except PlanRequired:
+        raise HTTPException(status_code=403, detail=f"The '{tier.name}' tier is only available to paid users")
+    remember_usage_limit(user_id, usage.usage_limit)
+    return usage
+
+def record_long_document(sentences, all_paraphrases, tier, elapsed_ms: float):
+    """
+    Long documents skip the paraphraser stack (cache, batcher, tier metrics): the
+    sentences are only known once the pool workers have segmented them. Record
+    the tier metrics and cache the results here, so later requests can use them.
+    """
+    tier_metrics.record(tier, len(sentences), elapsed_ms)
+    if paraphrase_cache is not None:
+        settings = {**paraphrase_engine.settings, **tier.settings}
+        paraphrase_cache.store([
+            (cache_key(sentence, settings), paraphrases)
+            for sentence, paraphrases in zip(sentences, all_paraphrases)
+        ])
 
 @app.post("/humanize", response_model=HumanizeResponse)
 async def humanize_text(request: HumanizeRequest, db: AsyncSession = Depends(get_db)):
     """
     Humanize the provided text by paraphrasing it using Parrot.
     Processes the text sentence by sentence for better accuracy.
+    The tier sets how many candidates are generated and scored per sentence.
+    Long documents are split into paragraphs that run in parallel on the
+    long-document process pool, if enabled; paragraph breaks are kept.
     Tracks usage per user and enforces usage limits.
     """
     try:
-        # Get or create user
-        user = await get_or_create_user(db, request.user_id)
+        await check_rate_limit(request.user_id, "humanize")
+        require_models()
+        tier = resolve_tier(request.tier)
         
         # Calculate word count and tokens for the input text
         word_count = len(request.text.split())
         token_count = word_count  # Using word count as token approximation
         
-        # Check if user has exceeded usage limit
-        if user.token_usage >= user.usage_limit:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Usage limit exceeded. Current usage: {user.token_usage}/{user.usage_limit}"
-            )
-        
-        # Check if this request would exceed the limit
-        if user.token_usage + token_count > user.usage_limit:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Request would exceed usage limit. Current usage: {user.token_usage}/{user.usage_limit}"
-            )
-        
-        # Use pre-loaded models
-        nlp_model = nlp
-        parrot_model = parrot
-        
-        # Split text into sentences using spaCy
-        doc = nlp_model(request.text)
-        sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
-        
-        humanized_sentences = []
-        
-        # Process each sentence separately
-        for sentence in sentences:
-            paraphrases = parrot_model.augment(input_phrase=sentence)
+        # Wait for an inference slot; overload is shed here with 429/503 before any credits are debited
+        async with admission.admit("humanize"):
+            # Check the limit and debit usage in one atomic statement
+            with STAGE_LATENCY.time("humanize", "quota"):
+                usage = await reserve_for_tier(db, request.user_id, token_count, word_count, tier)
             
-            if paraphrases:
-                # Get the paraphrase with the highest score
-                # paraphrases is a list of tuples: (text, score)
-                best_paraphrase = max(paraphrases, key=lambda x: x[1])[0]  # Get text with max score
-                
-                # Clean up and format the paraphrased text
-                # Remove extra whitespace
-                best_paraphrase = " ".join(best_paraphrase.split())
-                
-                # Capitalize first letter
-                best_paraphrase = best_paraphrase[0].upper() + best_paraphrase[1:] if best_paraphrase else best_paraphrase
-                
-                # Add period if sentence doesn't end with punctuation
-                if best_paraphrase and not best_paraphrase.rstrip()[-1] in '.!?':
-                    best_paraphrase += "."
-                
-                humanized_sentences.append(best_paraphrase)
-            else:
-                # If no paraphrase available, use original sentence
-                humanized_sentences.append(sentence)
+            # Run model inference on the worker pool so the event loop stays free
+            try:
+                if paragraph_pool and word_count >= LONG_DOCUMENT_MIN_WORDS:
+                    # Long documents: paragraphs are humanized in parallel on the process pool
+                    start = time.perf_counter()
+                    with STAGE_LATENCY.time("humanize", "paragraphs"):
+                        paragraphs, breaks = await paragraph_pool.humanize(request.text, tier)
+                    sentences = [sentence for paragraph, _ in paragraphs for sentence in paragraph]
+                    all_paraphrases = [item for _, paraphrases in paragraphs for item in paraphrases]
+                    paragraph_lengths = [len(paragraph) for paragraph, _ in paragraphs]
+                    record_long_document(sentences, all_paraphrases, tier, (time.perf_counter() - start) * 1000)
+                else:
+                    with STAGE_LATENCY.time("humanize", "segmentation"):
+                        sentences = await inference_executor.run(segment_text, request.text)
+                    
+                    # Sentences are batched together with those of other in-flight requests, by plan priority
+                    with STAGE_LATENCY.time("humanize", "paraphrase"):
+                        all_paraphrases = await paraphraser.paraphrase(
+                            sentences, tier, plan_for_limit(usage.usage_limit)
+                        )
+                    paragraph_lengths, breaks = [len(sentences)], []
+                SENTENCES_PER_REQUEST.observe(len(sentences), "humanize")
+            except Exception as e:
+                # Give the reserved credits back if inference fails
+                await release_credits(db, request.user_id, token_count, word_count)
+                if isinstance(e, InferenceQueueFull):
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+                raise
         
-        # Combine all humanized sentences with proper spacing
-        humanized_text = " ".join(humanized_sentences)
+        # Process each sentence separately
+        with STAGE_LATENCY.time("humanize", "formatting"):
+            humanized_sentences = [
+                pick_paraphrase(sentence, paraphrases)
+                for sentence, paraphrases in zip(sentences, all_paraphrases)
+            ]
         
-        # Update user usage
-        user.word_count += word_count
-        user.token_usage += token_count
-        await db.commit()
-        await db.refresh(user)
+        # Combine the humanized sentences of each paragraph with proper spacing, keeping paragraph breaks
+        humanized_paragraphs = []
+        position = 0
+        for length in paragraph_lengths:
+            humanized_paragraphs.append(" ".join(humanized_sentences[position:position + length]))
+            position += length
+        humanized_text = join_paragraphs(humanized_paragraphs, breaks)
         
         return {
             "original_text": request.text,
@@ -289,9 +605,10 @@ async def humanize_text(request: HumanizeRequest, db: AsyncSession = Depends(get
             "sentences": sentences,
             "humanized_sentences": humanized_sentences,
             "word_count": word_count,
-            "total_usage": user.token_usage,
-            "usage_limit": user.usage_limit,
-            "remaining_usage": user.usage_limit - user.token_usage
+            "total_usage": usage.token_usage,
+            "usage_limit": usage.usage_limit,
+            "remaining_usage": usage.usage_limit - usage.token_usage,
+            "tier": tier.name
         }
         
     except HTTPException:
@@ -299,6 +616,373 @@ async def humanize_text(request: HumanizeRequest, db: AsyncSession = Depends(get
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error humanizing text: {str(e)}")
 
+@app.post("/humanize/stream")
+async def humanize_text_stream(request: HumanizeRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Streaming variant of /humanize (newline-delimited JSON).
+    Emits a "start" event, then one "sentence" event per sentence as soon as it
+    is humanized (in completion order, with its index), and a final "done" event
+    with the full text and usage summary. Failures after the stream has started
+    are reported as an "error" event and the reserved credits are released.
+    """
+    try:
+        await check_rate_limit(request.user_id, "humanize/stream")
+        require_models()
+        tier = resolve_tier(request.tier)
+        
+        # Calculate word count and tokens for the input text
+        word_count = len(request.text.split())
+        token_count = word_count  # Using word count as token approximation
+        
+        # Wait for an inference slot; it is held until the last sentence has been paraphrased
+        ticket = await admission.acquire("humanize/stream")
+        try:
+            # Check the limit and debit usage in one atomic statement
+            with STAGE_LATENCY.time("humanize/stream", "quota"):
+                usage = await reserve_for_tier(db, request.user_id, token_count, word_count, tier)
+            priority = plan_for_limit(usage.usage_limit)
+            
+            try:
+                with STAGE_LATENCY.time("humanize/stream", "segmentation"):
+                    sentences = await inference_executor.run(segment_text, request.text)
+                SENTENCES_PER_REQUEST.observe(len(sentences), "humanize/stream")
+            except Exception as e:
+                await release_credits(db, request.user_id, token_count, word_count)
+                if isinstance(e, InferenceQueueFull):
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+                raise
+        except Exception:
+            ticket.release()
+            raise
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error humanizing text: {str(e)}")
+    
+    # With the batcher every sentence is queued on its own and sent as soon as its batch finishes.
+    # Without it every call is a job on the inference pool, so sentences go in chunks of
+    # BATCH_MAX_SIZE, one chunk at a time, rather than one job per sentence overflowing the pool.
+    chunk_size = 1 if paraphrase_batcher else BATCH_MAX_SIZE
+    
+    async def humanize_chunk(start: int):
+        chunk = sentences[start:start + chunk_size]
+        all_paraphrases = await paraphraser.paraphrase(chunk, tier, priority)
+        return [
+            (start + offset, pick_paraphrase(sentence, paraphrases))
+            for offset, (sentence, paraphrases) in enumerate(zip(chunk, all_paraphrases))
+        ]
+    
+    async def events():
+        yield json.dumps({"event": "start", "total_sentences": len(sentences), "tier": tier.name}) + "\n"
+        
+        starts = range(0, len(sentences), chunk_size)
+        if paraphrase_batcher:
+            tasks = [asyncio.ensure_future(humanize_chunk(start)) for start in starts]
+            completed = asyncio.as_completed(tasks)
+        else:
+            tasks = []
+            completed = (humanize_chunk(start) for start in starts)
+        humanized_sentences = [None] * len(sentences)
+        try:
+            for next_done in completed:
+                for index, humanized in await next_done:
+                    humanized_sentences[index] = humanized
+                    yield json.dumps({
+                        "event": "sentence",
+                        "index": index,
+                        "original": sentences[index],
+                        "humanized": humanized
+                    }) + "\n"
+        except Exception as e:
+            # Give the reserved credits back if inference fails
+            await release_credits(db, request.user_id, token_count, word_count)
+            yield json.dumps({"event": "error", "detail": f"Error humanizing text: {str(e)}"}) + "\n"
+            return
+        finally:
+            for task in tasks:
+                task.cancel()
+            ticket.release()
+        
+        yield json.dumps({
+            "event": "done",
+            "humanized_text": " ".join(humanized_sentences),
+            "word_count": word_count,
+            "total_usage": usage.token_usage,
+            "usage_limit": usage.usage_limit,
+            "remaining_usage": usage.usage_limit - usage.token_usage
+        }) + "\n"
+    
+    # The background task frees the slot if the stream is never consumed
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(ticket.release))
+
+@app.post("/humanize/batch", response_model=BatchHumanizeResponse)
+async def humanize_batch(request: BatchHumanizeRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Humanize a list of texts for one user.
+    Usage is debited once for the whole batch and all sentences of all texts go
+    through the model together. Items that fail are reported individually and
+    their credits are released.
+    """
+    if len(request.texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many texts in batch (maximum {BATCH_MAX_ITEMS})")
+    
+    try:
+        await check_rate_limit(request.user_id, "humanize/batch", len(request.texts))
+        require_models()
+        tier = resolve_tier(request.tier)
+        
+        word_counts = [len(text.split()) for text in request.texts]
+        word_count = sum(word_counts)
+        token_count = word_count  # Using word count as token approximation
+        
+        # Wait for an inference slot; overload is shed here with 429/503 before any credits are debited
+        async with admission.admit("humanize/batch"):
+            # Check the limit and debit usage for the whole batch at once
+            with STAGE_LATENCY.time("humanize/batch", "quota"):
+                usage = await reserve_for_tier(db, request.user_id, token_count, word_count, tier)
+            
+            try:
+                with STAGE_LATENCY.time("humanize/batch", "segmentation"):
+                    segmented = await inference_executor.run(segment_texts, request.texts)
+                
+                # One batched pass over the sentences of every text that segmented cleanly
+                all_sentences = [
+                    sentence for sentences in segmented if not isinstance(sentences, Exception)
+                    for sentence in sentences
+                ]
+                SENTENCES_PER_REQUEST.observe(len(all_sentences), "humanize/batch")
+                with STAGE_LATENCY.time("humanize/batch", "paraphrase"):
+                    all_paraphrases = await paraphraser.paraphrase(
+                        all_sentences, tier, plan_for_limit(usage.usage_limit)
+                    )
+            except Exception as e:
+                await release_credits(db, request.user_id, token_count, word_count)
+                if isinstance(e, InferenceQueueFull):
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+                raise
+        
+        results = []
+        failed_words = 0
+        position = 0
+        for index, (text, sentences) in enumerate(zip(request.texts, segmented)):
+            if isinstance(sentences, Exception):
+                failed_words += word_counts[index]
+                results.append({
+                    "index": index,
+                    "original_text": text,
+                    "word_count": word_counts[index],
+                    "error": f"Error humanizing text: {str(sentences)}"
+                })
+                continue
+            
+            paraphrases = all_paraphrases[position:position + len(sentences)]
+            position += len(sentences)
+            humanized_sentences = [
+                pick_paraphrase(sentence, item_paraphrases)
+                for sentence, item_paraphrases in zip(sentences, paraphrases)
+            ]
+            results.append({
+                "index": index,
+                "original_text": text,
+                "humanized_text": " ".join(humanized_sentences),
+                "sentences": sentences,
+                "humanized_sentences": humanized_sentences,
+                "word_count": word_counts[index]
+            })
+        
+        # Only successful items are charged
+        if failed_words:
+            await release_credits(db, request.user_id, failed_words, failed_words)
+        total_usage = usage.token_usage - failed_words
+        
+        return {
+            "results": results,
+            "word_count": word_count - failed_words,
+            "total_usage": total_usage,
+            "usage_limit": usage.usage_limit,
+            "remaining_usage": usage.usage_limit - total_usage,
+            "tier": tier.name
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error humanizing batch: {str(e)}")
+
+@app.post("/detect-ai/batch", response_model=BatchDetectAIResponse)
+async def detect_ai_batch(request: BatchDetectAIRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Detect AI-generated content in a list of texts for one user.
+    Usage is debited once for the whole batch and the texts are checked with
+    concurrent calls over the pooled Winston AI client. Items that fail are
+    reported individually and their credits are released.
+    """
+    if len(request.texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many texts in batch (maximum {BATCH_MAX_ITEMS})")
+    
+    try:
+        await check_rate_limit(request.user_id, "detect-ai/batch", len(request.texts))
+        
+        # Fail before debiting if the detector is not configured (e.g. no Winston AI token)
+        detector.check_config()
+        
+        word_counts = [len(text.split()) for text in request.texts]
+        word_count = sum(word_counts)
+        token_count = word_count  # Using word count as token approximation
+        
+        # Check the limit and debit usage for the whole batch at once
+        with STAGE_LATENCY.time("detect-ai/batch", "quota"):
+            usage = await reserve_credits(db, request.user_id, token_count, word_count)
+        remember_usage_limit(request.user_id, usage.usage_limit)
+        
+        with STAGE_LATENCY.time("detect-ai/batch", "winston"):
+            detections = await asyncio.gather(
+                *(detector.detect(text) for text in request.texts),
+                return_exceptions=True
+            )
+        
+        results = []
+        failed_words = 0
+        for index, detection in enumerate(detections):
+            if isinstance(detection, Exception):
+                failed_words += word_counts[index]
+                results.append({
+                    "index": index,
+                    "word_count": word_counts[index],
+                    "error": detection.detail if isinstance(detection, HTTPException)
+                             else f"Error calling Winston AI: {str(detection)}"
+                })
+            else:
+                results.append({"index": index, "word_count": word_counts[index], "result": detection})
+        
+        # Only successful items are charged
+        if failed_words:
+            await release_credits(db, request.user_id, failed_words, failed_words)
+        total_usage = usage.token_usage - failed_words
+        
+        return {
+            "results": results,
+            "word_count": word_count - failed_words,
+            "total_usage": total_usage,
+            "usage_limit": usage.usage_limit,
+            "remaining_usage": usage.usage_limit - total_usage
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error detecting AI in batch: {str(e)}")
+
+async def run_with_retry(fn, *args):
+    """Run background work, waiting for room instead of failing when the inference pool is full"""
+    while True:
+        try:
+            return await fn(*args)
+        except InferenceQueueFull:
+            await asyncio.sleep(0.5)
+
+async def run_humanize_job(job):
+    """Humanize a queued job's text, updating progress as each batch finishes"""
+    word_count = len(job.text.split())
+    token_count = word_count  # Using word count as token approximation
+    
+    try:
+        result = await humanize_job_text(job)
+    except BaseException:
+        # Give back the credits held at submit if the job fails or is cancelled
+        async with AsyncSessionLocal() as db:
+            await release_credits(db, job.user_id, token_count, word_count)
+        raise
+    
+    # The credits held at submit settle the job; nothing more is debited
+    return {
+        **result,
+        "word_count": word_count,
+        "total_usage": job.usage["token_usage"],
+        "usage_limit": job.usage["usage_limit"],
+        "remaining_usage": job.usage["usage_limit"] - job.usage["token_usage"],
+    }
+
+async def humanize_job_text(job):
+    tier = get_tier(job.tier)
+    
+    sentences = await run_with_retry(inference_executor.run, segment_text, job.text)
+    job.sentences_total = len(sentences)
+    SENTENCES_PER_REQUEST.observe(len(sentences), "humanize/jobs")
+    await job_runner.backend.save(job)
+    
+    humanized_sentences = []
+    chunk_size = BATCH_MAX_SIZE
+    for start in range(0, len(sentences), chunk_size):
+        chunk = sentences[start:start + chunk_size]
+        # Jobs are background work, so they yield to interactive requests in the batcher
+        all_paraphrases = await run_with_retry(paraphraser.paraphrase, chunk, tier, "bulk")
+        humanized_sentences.extend(
+            pick_paraphrase(sentence, paraphrases)
+            for sentence, paraphrases in zip(chunk, all_paraphrases)
+        )
+        job.sentences_done = len(humanized_sentences)
+        await job_runner.backend.save(job)
+    
+    return {
+        "original_text": job.text,
+        "humanized_text": " ".join(humanized_sentences),
+        "sentences": sentences,
+        "humanized_sentences": humanized_sentences,
+        "tier": tier.name
+    }
+
+def job_response(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "sentences_done": job.sentences_done,
+        "sentences_total": job.sentences_total,
+        "result": job.result,
+        "error": job.error
+    }
+
+@app.post("/humanize/jobs", response_model=HumanizeJobResponse, status_code=202)
+async def create_humanize_job(request: HumanizeRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Queue text for humanization and return a job id immediately.
+    The job's credits are held now and given back if the job fails.
+    """
+    try:
+        await check_rate_limit(request.user_id, "humanize/jobs")
+        require_models()
+        tier = resolve_tier(request.tier)
+        
+        word_count = len(request.text.split())
+        token_count = word_count  # Using word count as token approximation
+        
+        # Hold the credits now, so queued jobs cannot spend more than the user has left
+        usage = await reserve_for_tier(db, request.user_id, token_count, word_count, tier)
+        
+        try:
+            job = await job_runner.submit(
+                request.user_id, request.text, tier.name,
+                usage={"token_usage": usage.token_usage, "usage_limit": usage.usage_limit},
+            )
+        except Exception:
+            await release_credits(db, request.user_id, token_count, word_count)
+            raise
+        return job_response(job)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating humanize job: {str(e)}")
+
+@app.get("/humanize/jobs/{job_id}", response_model=HumanizeJobResponse)
+async def get_humanize_job(job_id: str):
+    """Get progress (sentences done / total) and, once completed, the result of a job"""
+    job = await job_runner.backend.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job_response(job)
+
 @app.post("/update-limit")
 async def update_usage_limit(request: UpdateLimitRequest, db: AsyncSession = Depends(get_db)):
     """
@@ -326,12 +1010,20 @@ async def update_usage_limit(request: UpdateLimitRequest, db: AsyncSession = Dep
         await db.commit()
         await db.refresh(user)
         
+        remember_usage_limit(user.user_id, user.usage_limit)
+        
+        # Include usage not yet flushed by the write-behind ledger
+        token_usage = user.token_usage
+        if usage_ledger:
+            usage_ledger.set_limit(user.user_id, user.usage_limit)
+            token_usage += usage_ledger.unflushed(user.user_id)[0]
+        
         return {
             "user_id": user.user_id,
             "old_limit": old_limit,
             "credits_added": request.credits_to_add,
             "new_limit": user.usage_limit,
-            "current_usage": user.token_usage,
+            "current_usage": token_usage,
             "message": f"Added {request.credits_to_add} credits. Usage limit updated from {old_limit} to {user.usage_limit}"
         }
     except HTTPException:
@@ -349,20 +1041,72 @@ async def get_user_usage(user_id: str, db: AsyncSession = Depends(get_db)):
         if not user:
             raise HTTPException(status_code=404, detail=f"User {user_id} not found")
         
+        # Include usage not yet flushed by the write-behind ledger
+        word_count, token_usage = user.word_count, user.token_usage
+        if usage_ledger:
+            pending_tokens, pending_words = usage_ledger.unflushed(user_id)
+            token_usage += pending_tokens
+            word_count += pending_words
+        
         return {
             "user_id": user.user_id,
-            "word_count": user.word_count,
-            "token_usage": user.token_usage,
+            "word_count": word_count,
+            "token_usage": token_usage,
             "usage_limit": user.usage_limit,
-            "remaining_usage": user.usage_limit - user.token_usage,
-            "usage_percentage": (user.token_usage / user.usage_limit * 100) if user.usage_limit > 0 else 0
+            "remaining_usage": user.usage_limit - token_usage,
+            "usage_percentage": (token_usage / user.usage_limit * 100) if user.usage_limit > 0 else 0
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting user usage: {str(e)}")
 
+@app.get("/stats")
+async def get_stats():
+    """Runtime statistics for sizing the inference pool, batcher and caches"""
+    return {
+        "inference_pool": inference_executor.stats() if inference_executor else None,
+        "backends": {
+            "paraphrase": PARAPHRASE_BACKEND,
+            "batching": PARAPHRASE_BATCHING,
+            "paraphrase_cache": PARAPHRASE_CACHE_ENABLED,
+            "detection": DETECTION_BACKEND,
+            "detection_cache": DETECTION_CACHE_ENABLED,
+        },
+        "admission": admission.stats(),
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        "batcher": paraphrase_batcher.stats() if paraphrase_batcher else None,
+        "long_documents": paragraph_pool.stats() if paragraph_pool else None,
+        "quality_tiers": tier_metrics.stats(),
+        "paraphrase_cache": paraphrase_cache.stats() if paraphrase_cache else None,
+        "detection_cache": detection_cache.stats() if DETECTION_CACHE_ENABLED else None,
+        "usage_ledger": usage_ledger.stats() if usage_ledger else None,
+        "jobs": job_runner.stats() if job_runner else None,
+    }
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Request, stage, model, queue, DB pool and upstream metrics in Prometheus text format"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def readiness_check():
+    """Per-model load state and time, and the CPU settings in use; 503 until every model is loaded and warmed up"""
+    models = model_status.stats()
+    if model_status.ready:
+        status = "ready"
+    elif any(model["state"] == "failed" for model in models.values()):
+        status = "failed"
+    else:
+        status = "loading"
+    return JSONResponse(
+        status_code=200 if status == "ready" else 503,
+        content={"status": status, "models": models, "cpu": cpu_settings.stats()}
+    )
+
@@ -0,0 +1,245 @@
+"""
+Prometheus-style metrics for the /metrics endpoint.
+
+A small in-process registry of counters, histograms and callback gauges,
+rendered in the Prometheus text exposition format. Recording a value is a dict
+lookup plus a bisect over the bucket bounds, cheap enough to leave on in
+production. Values are recorded from the event loop (and the GIL covers the
+few updates made from inference threads), so no locks are taken.
+
+Metrics are per process; with several workers, scrape each one or aggregate
+them in Prometheus.
+"""
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Latency buckets in seconds, from cache hits to long documents
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: str):
+        """Observe the duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self) -> Iterable[str]:
+        for label_values, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time; the callback returns {label values: value}"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._callback: Callable[[], Dict[Tuple[str, ...], float]] = None
+
+    def set_callback(self, callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        self._callback = callback
+
+    def samples(self) -> Iterable[str]:
+        if self._callback is None:
+            return
+        try:
+            values = self._callback()
+        except Exception:
+            # A component that is not started yet has nothing to report
+            return
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "humanizer_http_requests_total", "HTTP requests by route and status code", ["method", "route", "status"]
+))
+HTTP_LATENCY = registry.register(Histogram(
+    "humanizer_http_request_duration_seconds", "HTTP request latency by route", ["method", "route"]
+))
+STAGE_LATENCY = registry.register(Histogram(
+    "humanizer_stage_duration_seconds", "Time spent in each stage of an endpoint", ["endpoint", "stage"]
+))
+SENTENCES_PER_REQUEST = registry.register(Histogram(
+    "humanizer_sentences_per_request", "Sentences per humanize request", ["endpoint"], buckets=SIZE_BUCKETS
+))
+MODEL_BATCH_LATENCY = registry.register(Histogram(
+    "humanizer_model_batch_duration_seconds", "Paraphrase engine time per batch", ["tier"]
+))
+MODEL_BATCH_SIZE = registry.register(Histogram(
+    "humanizer_model_batch_size", "Sentences per paraphrase engine batch", ["tier"], buckets=SIZE_BUCKETS
+))
+MODEL_ERRORS = registry.register(Counter(
+    "humanizer_model_errors_total", "Paraphrase engine batches that failed", ["tier"]
+))
+UPSTREAM_REQUESTS = registry.register(Counter(
+    "humanizer_upstream_requests_total", "Calls to upstream services by outcome", ["upstream", "outcome"]
+))
+UPSTREAM_LATENCY = registry.register(Histogram(
+    "humanizer_upstream_duration_seconds", "Upstream call latency", ["upstream"]
+))
+PRIORITY_QUEUE_WAIT = registry.register(Histogram(
+    "humanizer_priority_queue_wait_seconds", "Time sentences waited in the batcher by priority class", ["priority"]
+))
+PRIORITY_AGED = registry.register(Counter(
+    "humanizer_priority_aged_total", "Sentences served ahead of their turn after waiting PRIORITY_MAX_WAIT_MS",
+    ["priority"]
+))
+ADMISSION_WAIT = registry.register(Histogram(
+    "humanizer_admission_wait_seconds", "Time admitted requests waited for an inference slot", ["endpoint"]
+))
+ADMISSION_SHED = registry.register(Counter(
+    "humanizer_admission_shed_total", "Requests rejected by admission control", ["endpoint", "reason"]
+))
+RATE_LIMITED = registry.register(Counter(
+    "humanizer_rate_limited_total", "Requests rejected by the per-user rate limiter", ["endpoint", "plan"]
+))
+QUEUE_DEPTH = registry.register(Gauge(
+    "humanizer_queue_depth", "Work waiting or running in each internal queue", ["queue"]
+))
+DB_POOL = registry.register(Gauge(
+    "humanizer_db_pool_connections", "Database connection pool usage", ["state"]
+))
+TORCH_THREADS = registry.register(Gauge(
+    "humanizer_torch_threads", "Torch thread pool sizes in use", ["kind"]
+))
+PINNED_CPUS = registry.register(Gauge(
+    "humanizer_pinned_cpus", "Cores this worker is pinned to (absent when not pinned)"
+))
+CALIBRATION_THROUGHPUT = registry.register(Gauge(
+    "humanizer_thread_calibration_sentences_per_second", "Engine throughput measured at startup per thread count",
+    ["threads"]
+))
+
+
+def db_pool_stats(engine) -> Dict[Tuple[str, ...], float]:
+    """Connection counts of a SQLAlchemy (async) engine's pool, if it is a sized pool"""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {}
+    return {
+        ("size",): pool.size(),
+        ("checked_out",): pool.checkedout(),
+        ("checked_in",): pool.checkedin(),
+        ("overflow",): pool.overflow(),
+    }
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route templates (e.g. /humanize/jobs/{job_id}) keep label cardinality bounded
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], path)
+            HTTP_REQUESTS.inc(scope["method"], path, str(status[0]))
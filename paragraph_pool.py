@@ -0,0 +1,158 @@
+"""
+Paragraph-parallel humanization of long documents across a process pool.
+
+A long /humanize request otherwise keeps roughly one core busy: its sentences go
+through the engine from one thread, batch after batch. In long-document mode
+the text is split at paragraph boundaries (blank lines), consecutive paragraphs
+are grouped into chunks of similar word count, and the chunks are fanned out to
+LONG_DOCUMENT_WORKERS worker processes. Each worker loads its own paraphrase
+engine and segmenter and runs torch with LONG_DOCUMENT_TORCH_THREADS intra-op
+threads (by default its share of the cores this server worker may use), so N
+workers keep N cores busy on one document. Results come back in
+document order and the original paragraph breaks are kept.
+
+Every worker holds a full copy of the models, so memory grows with the number
+of workers. Workers are started with "spawn" so they never inherit a forked
+copy of the parent's torch thread pools.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+from cpu_tuning import worker_cores
+
+# 0 disables long-document mode
+LONG_DOCUMENT_WORKERS = int(os.getenv("LONG_DOCUMENT_WORKERS", 0))
+LONG_DOCUMENT_MIN_WORDS = int(os.getenv("LONG_DOCUMENT_MIN_WORDS", 1000))
+# 0 gives each worker its share of this server worker's cores (see cpu_tuning.worker_cores)
+LONG_DOCUMENT_TORCH_THREADS = int(os.getenv("LONG_DOCUMENT_TORCH_THREADS", 0))
+# Chunks per worker; more than one evens out paragraphs of uneven length
+LONG_DOCUMENT_CHUNKS_PER_WORKER = int(os.getenv("LONG_DOCUMENT_CHUNKS_PER_WORKER", 2))
+
+_PARAGRAPH_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+
+# Per-process state of pool workers
+_engine = None
+_segmenter = None
+
+
+def split_paragraphs(text: str) -> Tuple[List[str], List[str]]:
+    """Split text at blank lines; returns the paragraphs and the breaks between them"""
+    parts = _PARAGRAPH_BREAK.split(text)
+    return parts[0::2], parts[1::2]
+
+
+def join_paragraphs(paragraphs: Sequence[str], breaks: Sequence[str]) -> str:
+    """Inverse of split_paragraphs: put the original breaks back between paragraphs"""
+    pieces = []
+    for i, paragraph in enumerate(paragraphs):
+        if i:
+            pieces.append(breaks[i - 1])
+        pieces.append(paragraph)
+    return "".join(pieces)
+
+
+def group_paragraphs(paragraphs: Sequence[str], chunks: int) -> List[List[str]]:
+    """Group consecutive paragraphs into about `chunks` runs of similar word count"""
+    target = math.ceil(sum(len(p.split()) for p in paragraphs) / max(1, chunks))
+    groups, current, words = [], [], 0
+    for paragraph in paragraphs:
+        current.append(paragraph)
+        words += len(paragraph.split())
+        if words >= target:
+            groups.append(current)
+            current, words = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _init_worker(torch_threads: int):
+    """Load the engine and segmenter once per worker process"""
+    global _engine, _segmenter
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+
+    from backends import PARAPHRASE_BACKEND, load_engine
+    from segmentation import Segmenter
+
+    _engine = load_engine(PARAPHRASE_BACKEND)
+    _segmenter = Segmenter()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _humanize_paragraphs(paragraphs: List[str], settings: dict):
+    """Segment a run of paragraphs and paraphrase all of their sentences in one engine call"""
+    segmented = _segmenter.segment_many(paragraphs)
+    sentences = [sentence for paragraph in segmented for sentence in paragraph]
+    paraphrases = _engine.paraphrase_batch(sentences, **settings) if sentences else []
+
+    results, position = [], 0
+    for paragraph in segmented:
+        results.append((paragraph, paraphrases[position:position + len(paragraph)]))
+        position += len(paragraph)
+    return results
+
+
+class ParagraphPool:
+    """Process pool that humanizes the paragraphs of one document in parallel"""
+
+    def __init__(self, workers: int = LONG_DOCUMENT_WORKERS, torch_threads: int = LONG_DOCUMENT_TORCH_THREADS,
+                 chunks_per_worker: int = LONG_DOCUMENT_CHUNKS_PER_WORKER):
+        self.workers = max(1, workers)
+        # Not at import time: pinning (configure_worker) decides how many cores this process has
+        self.torch_threads = torch_threads or max(1, worker_cores() // self.workers)
+        self.chunks_per_worker = max(1, chunks_per_worker)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.torch_threads,),
+        )
+        self.documents = 0
+        self.chunks = 0
+
+    def start(self):
+        """Spawn the workers now so they load their models before the first long document"""
+        for _ in range(self.workers):
+            self._executor.submit(_ping)
+
+    async def humanize(self, text: str, tier) -> Tuple[List[Tuple[List[str], list]], List[str]]:
+        """
+        Humanize text paragraph by paragraph on the pool.
+        Returns (sentences, paraphrases) for each paragraph, and the paragraph breaks.
+        """
+        paragraphs, breaks = split_paragraphs(text)
+        groups = group_paragraphs(paragraphs, self.workers * self.chunks_per_worker)
+
+        loop = asyncio.get_running_loop()
+        chunk_results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _humanize_paragraphs, group, tier.settings)
+            for group in groups
+        ))
+        self.documents += 1
+        self.chunks += len(groups)
+        return [result for chunk in chunk_results for result in chunk], breaks
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "min_words": LONG_DOCUMENT_MIN_WORDS,
+            "documents": self.documents,
+            "chunks": self.chunks,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
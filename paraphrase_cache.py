@@ -0,0 +1,252 @@
+"""
+Sentence-level paraphrase cache.
+
+Users resubmit the same drafts with small edits, so most sentences of a request
+have usually been paraphrased before. Results are keyed on the normalized
+sentence plus the generation settings and kept in:
+- an in-memory LRU tier bounded by entry count and approximate size in bytes
+- an optional SQLite tier (PARAPHRASE_CACHE_PATH) that survives restarts
+
+The SQLite tier never runs on the event loop. A request's memory misses are
+looked up in one query on the default executor. New results go to a writer
+thread, which commits everything queued in one transaction. Write errors, such
+as another worker holding the database lock for too long, are logged and
+counted, never raised: the paraphrase has already succeeded. Once the file
+holds more than PARAPHRASE_CACHE_DISK_MAX_ENTRIES entries, the writer deletes
+the oldest written ones.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PARAPHRASE_CACHE_SIZE = int(os.getenv("PARAPHRASE_CACHE_SIZE", 10000))
+PARAPHRASE_CACHE_MAX_BYTES = int(os.getenv("PARAPHRASE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PARAPHRASE_CACHE_PATH = os.getenv("PARAPHRASE_CACHE_PATH")
+# 0 leaves the SQLite tier unbounded
+PARAPHRASE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("PARAPHRASE_CACHE_DISK_MAX_ENTRIES", 1000000))
+
+# Requests' results waiting for the writer; beyond this they are kept in memory only
+_WRITE_QUEUE_SIZE = 1000
+# Rows written between checks of the disk bound
+_PRUNE_EVERY = 1000
+
+
+def normalize_sentence(sentence: str) -> str:
+    """Collapse whitespace so trivially different copies share a cache entry"""
+    return " ".join(sentence.split())
+
+
+def cache_key(sentence: str, settings: dict) -> str:
+    """Hash of the normalized sentence and the settings it was paraphrased with"""
+    raw = json.dumps({"sentence": normalize_sentence(sentence), "settings": settings}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ParaphraseCache:
+    """Two-tier (memory LRU + optional SQLite) cache of paraphrase results"""
+
+    def __init__(self, max_entries: int = PARAPHRASE_CACHE_SIZE,
+                 max_bytes: int = PARAPHRASE_CACHE_MAX_BYTES,
+                 path: Optional[str] = PARAPHRASE_CACHE_PATH,
+                 disk_max_entries: int = PARAPHRASE_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.path = path
+        self.disk_max_entries = max(0, disk_max_entries)
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_writes = 0
+        self.disk_evictions = 0
+        self.write_errors = 0
+        self.dropped_writes = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes: "queue.Queue" = queue.Queue(maxsize=_WRITE_QUEUE_SIZE)
+        self._writer = None
+        if path:
+            self._db = self._connect()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS paraphrases (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+            self._writer = threading.Thread(target=self._write_loop, name="paraphrase-cache-writer", daemon=True)
+            self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Waiting on another worker's write lock only ever blocks a cache thread, never the event loop
+        return sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+
+    async def lookup(self, keys: Sequence[str]) -> List[Optional[List[Tuple[str, int]]]]:
+        """Results for keys (None for misses): memory first, then one SQLite query off the loop"""
+        results = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    results[i] = self._decode(entry[0])
+                else:
+                    missing.append(i)
+
+        if missing and self._db is not None:
+            loop = asyncio.get_running_loop()
+            found = await loop.run_in_executor(None, self._load, [keys[i] for i in missing])
+            for i in missing:
+                raw = found.get(keys[i])
+                if raw is not None:
+                    results[i] = self._decode(raw)
+            missing = [i for i in missing if results[i] is None]
+        self.misses += len(missing)
+        return results
+
+    def _load(self, keys: List[str]) -> Dict[str, str]:
+        """Read keys from the SQLite tier into memory (runs on an executor thread)"""
+        found = {}
+        try:
+            with self._db_lock:
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, value FROM paraphrases WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    found.update(rows)
+        except sqlite3.Error as e:
+            print(f"Paraphrase cache read failed: {e}")
+            return {}
+
+        with self._lock:
+            self.disk_hits += len(found)
+            for key, raw in found.items():
+                self._remember(key, raw)
+        return found
+
+    def store(self, items: Sequence[Tuple[str, List[Tuple[str, int]]]]):
+        """Cache (key, value) pairs: in memory now, on disk through the writer thread"""
+        rows = [(key, json.dumps(value)) for key, value in items]
+        with self._lock:
+            for key, raw in rows:
+                self._remember(key, raw)
+        if self._writer is not None and rows:
+            try:
+                self._writes.put_nowait(rows)
+            except queue.Full:
+                self.dropped_writes += len(rows)
+
+    def _write_loop(self):
+        db = self._connect()
+        self._prune(db)
+        since_prune = 0
+        stopping = False
+        while not stopping:
+            batch = self._writes.get()
+            if batch is None:
+                break
+            rows = list(batch)
+            # Everything queued meanwhile goes into the same transaction
+            while True:
+                try:
+                    batch = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    stopping = True
+                    break
+                rows.extend(batch)
+
+            try:
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO paraphrases (key, value) VALUES (?, ?)", rows)
+                self.disk_writes += len(rows)
+                since_prune += len(rows)
+                if since_prune >= _PRUNE_EVERY:
+                    since_prune = 0
+                    self._prune(db)
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                print(f"Paraphrase cache write of {len(rows)} entries failed: {e}")
+        db.close()
+
+    def _prune(self, db: sqlite3.Connection):
+        """Delete the oldest written entries beyond disk_max_entries (REPLACE gives a new rowid)"""
+        if not self.disk_max_entries:
+            return
+        try:
+            count = db.execute("SELECT count(*) FROM paraphrases").fetchone()[0]
+            excess = count - self.disk_max_entries
+            if excess > 0:
+                with db:
+                    db.execute(
+                        "DELETE FROM paraphrases WHERE rowid IN "
+                        "(SELECT rowid FROM paraphrases ORDER BY rowid LIMIT ?)", (excess,)
+                    )
+                self.disk_evictions += excess
+        except sqlite3.Error as e:
+            print(f"Paraphrase cache pruning failed: {e}")
+
+    def _remember(self, key: str, raw: str):
+        """Add an entry to the memory tier and evict least recently used ones"""
+        size = len(key) + len(raw)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        if size > self.max_bytes or self.max_entries == 0:
+            return
+
+        self._entries[key] = (raw, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    @staticmethod
+    def _decode(raw: str) -> List[Tuple[str, int]]:
+        return [tuple(item) for item in json.loads(raw)]
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "persistent": self._db is not None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_max_entries": self.disk_max_entries,
+            "disk_writes": self.disk_writes,
+            "disk_evictions": self.disk_evictions,
+            "pending_writes": self._writes.qsize(),
+            "write_errors": self.write_errors,
+            "dropped_writes": self.dropped_writes,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0,
+        }
+
+    def close(self):
+        """Let the writer commit what is queued, then close the database"""
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join(timeout=10)
+            self._writer = None
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,230 @@
+"""
+Batched paraphrase engine built on top of a loaded Parrot instance.
+
+Parrot.augment() runs one T5 generate pass (plus one adequacy and one fluency
+forward pass per candidate) for every sentence. This engine keeps the same
+selection logic but sends all sentences through the models together:
+- sentences are sorted by token length and grouped into padded batches
+- candidates for every sentence are scored for adequacy and fluency in bulk
+
+torch is imported on first use, so importing this module (e.g. for its
+settings) stays cheap.
+
+Several inference threads may run batches on the same engine at once. Model
+forward passes are safe to share, but the Rust-backed fast tokenizers are not
+(a concurrent call fails with "Already borrowed"), so every tokenizer call
+holds one lock. Tokenizing is a small part of a batch, so this costs little.
+"""
+import os
+import re
+import threading
+from typing import List, Sequence, Tuple
+
+# Same character filter Parrot applies to inputs and generated candidates
+_CLEAN_RE = re.compile(r"[^a-zA-Z0-9 \?\'\-\/\:\.]")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+PARROT_MODEL_TAG = "prithivida/parrot_paraphraser_on_T5"
+
+# Parrot.augment() defaults
+DEFAULT_SETTINGS = {
+    "max_return_phrases": 10,
+    "max_length": 32,
+    "adequacy_threshold": 0.90,
+    "fluency_threshold": 0.90,
+    "do_diverse": False,
+}
+
+PARAPHRASE_BATCH_SIZE = int(os.getenv("PARAPHRASE_BATCH_SIZE", 8))
+SCORING_BATCH_SIZE = int(os.getenv("SCORING_BATCH_SIZE", 64))
+
+
+def _words(text: str) -> List[str]:
+    """Lowercase words of text, ignoring punctuation and spacing"""
+    return _WORD_RE.findall(text.lower())
+
+
+class BatchParaphraser:
+    """Runs Parrot's generate/filter/rank pipeline over many sentences at once"""
+
+    def __init__(self, parrot, batch_size: int = PARAPHRASE_BATCH_SIZE,
+                 scoring_batch_size: int = SCORING_BATCH_SIZE, device: str = "cpu",
+                 backend: str = "torch"):
+        self.parrot = parrot
+        self.batch_size = max(1, batch_size)
+        self.scoring_batch_size = max(1, scoring_batch_size)
+        self.device = device
+        # Quantized backends can pick slightly different candidates
+        self.backend = backend
+        self._tokenizer_lock = threading.Lock()
+
+    @property
+    def settings(self) -> dict:
+        """Everything that affects the output, used as part of cache keys"""
+        return {
+            "model_tag": PARROT_MODEL_TAG, "backend": self.backend,
+            "unfiltered_pick": "closest", **DEFAULT_SETTINGS,
+        }
+
+    def paraphrase_batch(
+        self,
+        sentences: Sequence[str],
+        max_return_phrases: int = 10,
+        max_length: int = 32,
+        adequacy_threshold: float = 0.90,
+        fluency_threshold: float = 0.90,
+        do_diverse: bool = False,
+        use_filters: bool = True,
+    ) -> List[List[Tuple[str, int]]]:
+        """
+        Paraphrase every sentence and return, per sentence, the same list of
+        (text, score) tuples Parrot.augment() would return.
+        With use_filters=False the adequacy and fluency models are skipped and
+        only the candidate closest to the input (by Levenshtein distance) that
+        still changes it is returned.
+        """
+        if not sentences:
+            return []
+
+        prepared = ["paraphrase: " + _CLEAN_RE.sub("", sentence) for sentence in sentences]
+        candidates = self._generate(sentences, prepared, max_return_phrases, max_length, do_diverse)
+
+        if use_filters:
+            adequate = self._filter_adequacy(prepared, candidates, adequacy_threshold)
+            fluent = self._filter_fluency(adequate, fluency_threshold)
+        else:
+            fluent = candidates
+
+        results = []
+        for i, sentence in enumerate(sentences):
+            if not fluent[i]:
+                # Parrot falls back to the original sentence when nothing passes
+                results.append([(sentence, 0)])
+                continue
+            ranked = self.parrot.diversity_score.rank(prepared[i], fluent[i], "levenshtein")
+            para_phrases = list(ranked.items())
+            if use_filters:
+                para_phrases.sort(key=lambda x: x[1], reverse=True)
+            else:
+                # Without the adequacy check, the most diverse candidates are the likeliest
+                # to have lost the meaning, so keep the closest one that changes anything
+                original = _words(sentence)
+                changed = [item for item in para_phrases if _words(item[0]) != original]
+                para_phrases = [min(changed or para_phrases, key=lambda x: x[1])]
+            results.append(para_phrases)
+        return results
+
+    def _tokenize(self, tokenizer, *args, **kwargs):
+        """Call a tokenizer while no other thread uses any of the engine's tokenizers"""
+        with self._tokenizer_lock:
+            return tokenizer(*args, **kwargs)
+
+    def _generate(self, sentences, prepared, max_return_phrases, max_length, do_diverse):
+        """Generate candidate paraphrases in length-bucketed, padded batches"""
+        import torch
+
+        tokenizer = self.parrot.tokenizer
+        model = self.parrot.model
+
+        # Sort by token length so each padded batch wastes as little work as possible
+        lengths = [len(ids) for ids in self._tokenize(tokenizer, list(prepared))["input_ids"]]
+        order = sorted(range(len(prepared)), key=lambda i: lengths[i])
+
+        candidates: List[List[str]] = [[] for _ in prepared]
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start:start + self.batch_size]
+            # Parrot allows longer outputs for long inputs; use the largest in the bucket
+            bucket_max_length = max(
+                max_length + 32 if len(sentences[i]) >= max_length else max_length
+                for i in bucket
+            )
+            encoded = self._tokenize(
+                tokenizer, [prepared[i] for i in bucket], return_tensors="pt", padding=True
+            ).to(self.device)
+
+            with torch.no_grad():
+                if do_diverse:
+                    for n in range(2, 9):
+                        if max_return_phrases % n == 0:
+                            break
+                    preds = model.generate(
+                        **encoded,
+                        do_sample=False,
+                        max_length=bucket_max_length,
+                        num_beams=max_return_phrases,
+                        num_beam_groups=n,
+                        diversity_penalty=2.0,
+                        early_stopping=True,
+                        num_return_sequences=max_return_phrases,
+                    )
+                else:
+                    preds = model.generate(
+                        **encoded,
+                        do_sample=True,
+                        max_length=bucket_max_length,
+                        top_k=50,
+                        top_p=0.95,
+                        early_stopping=True,
+                        num_return_sequences=max_return_phrases,
+                    )
+
+            with self._tokenizer_lock:
+                decoded = tokenizer.batch_decode(preds, skip_special_tokens=True)
+            for j, i in enumerate(bucket):
+                seen = set()
+                for text in decoded[j * max_return_phrases:(j + 1) * max_return_phrases]:
+                    text = _CLEAN_RE.sub("", text.lower())
+                    if text not in seen:
+                        seen.add(text)
+                        candidates[i].append(text)
+        return candidates
+
+    def _filter_adequacy(self, prepared, candidates, threshold):
+        """Keep candidates whose adequacy score passes, scoring all pairs in bulk"""
+        import torch
+
+        adequacy = self.parrot.adequacy_score
+        pairs = [(i, text) for i, texts in enumerate(candidates) for text in texts]
+        kept: List[List[str]] = [[] for _ in candidates]
+
+        for start in range(0, len(pairs), self.scoring_batch_size):
+            chunk = pairs[start:start + self.scoring_batch_size]
+            encoded = self._tokenize(
+                adequacy.tokenizer,
+                [prepared[i] for i, _ in chunk],
+                [text for _, text in chunk],
+                return_tensors="pt",
+                max_length=128,
+                truncation=True,
+                padding=True,
+            ).to(self.device)
+            with torch.no_grad():
+                probs = adequacy.adequacy_model(**encoded).logits.softmax(dim=1)[:, 1]
+            for (i, text), score in zip(chunk, probs.tolist()):
+                if score >= threshold:
+                    kept[i].append(text)
+        return kept
+
+    def _filter_fluency(self, candidates, threshold):
+        """Keep candidates whose fluency score passes, scoring all phrases in bulk"""
+        import torch
+
+        fluency = self.parrot.fluency_score
+        items = [(i, text) for i, texts in enumerate(candidates) for text in texts]
+        kept: List[List[str]] = [[] for _ in candidates]
+
+        for start in range(0, len(items), self.scoring_batch_size):
+            chunk = items[start:start + self.scoring_batch_size]
+            encoded = self._tokenize(
+                fluency.fluency_tokenizer,
+                ["Sentence: " + text for _, text in chunk],
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+            ).to(self.device)
+            with torch.no_grad():
+                probs = fluency.fluency_model(**encoded).logits.softmax(dim=1)[:, 1]
+            for (i, text), score in zip(chunk, probs.tolist()):
+                if score >= threshold:
+                    kept[i].append(text)
+        return kept
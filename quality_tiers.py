@@ -0,0 +1,104 @@
+"""
+Quality/latency tiers for humanization.
+
+Each request can pick a tier that sets how much candidate generation and
+scoring is done per sentence:
+- fast:     3 sampled candidates, no adequacy/fluency scoring; the one closest to the input wins
+- balanced: Parrot's default settings (10 sampled candidates, both filters)
+- best:     10-beam diverse beam search with both filters; for paid users only
+
+The latency budget of a tier is the target time for one short request (a few
+sentences), measured from queueing to paraphrases being ready. Per-tier metrics
+count how often requests go over it.
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict
+
+from paraphrase_engine import DEFAULT_SETTINGS
+
+DEFAULT_QUALITY_TIER = os.getenv("DEFAULT_QUALITY_TIER", "balanced").lower()
+# Users with at least this usage limit (i.e. who bought credits) may use paid tiers
+PAID_TIER_MIN_LIMIT = int(os.getenv("PAID_TIER_MIN_LIMIT", int(os.getenv("DEFAULT_USAGE_LIMIT", 400)) + 1))
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    name: str
+    settings: dict  # keyword arguments for BatchParaphraser.paraphrase_batch
+    latency_budget_ms: float
+    paid_only: bool = False
+
+
+QUALITY_TIERS: Dict[str, QualityTier] = {
+    "fast": QualityTier(
+        name="fast",
+        settings={**DEFAULT_SETTINGS, "max_return_phrases": 3, "use_filters": False},
+        latency_budget_ms=float(os.getenv("FAST_TIER_BUDGET_MS", 300)),
+    ),
+    "balanced": QualityTier(
+        name="balanced",
+        settings={**DEFAULT_SETTINGS, "use_filters": True},
+        latency_budget_ms=float(os.getenv("BALANCED_TIER_BUDGET_MS", 1500)),
+    ),
+    "best": QualityTier(
+        name="best",
+        settings={**DEFAULT_SETTINGS, "do_diverse": True, "use_filters": True},
+        latency_budget_ms=float(os.getenv("BEST_TIER_BUDGET_MS", 4000)),
+        paid_only=True,
+    ),
+}
+
+
+def get_tier(name: str = None) -> QualityTier:
+    """Look up a tier by name (None for DEFAULT_QUALITY_TIER); raises KeyError if unknown"""
+    return QUALITY_TIERS[(name or DEFAULT_QUALITY_TIER).lower()]
+
+
+def tier_min_limit(tier: QualityTier) -> int:
+    """Lowest usage limit that may use the tier (0 for tiers open to everyone)"""
+    return PAID_TIER_MIN_LIMIT if tier.paid_only else 0
+
+
+def tier_allowed(tier: QualityTier, usage_limit: int) -> bool:
+    return usage_limit >= tier_min_limit(tier)
+
+
+class TierMetrics:
+    """Request counts and latency per tier, measured around the paraphraser"""
+
+    def __init__(self):
+        self._stats = {
+            name: {"requests": 0, "sentences": 0, "cached_sentences": 0,
+                   "total_ms": 0.0, "max_ms": 0.0, "over_budget": 0}
+            for name in QUALITY_TIERS
+        }
+
+    def record(self, tier: QualityTier, sentences: int, elapsed_ms: float):
+        stats = self._stats[tier.name]
+        stats["requests"] += 1
+        stats["sentences"] += sentences
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if elapsed_ms > tier.latency_budget_ms:
+            stats["over_budget"] += 1
+
+    def record_cached(self, tier: QualityTier, sentences: int):
+        self._stats[tier.name]["cached_sentences"] += sentences
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "latency_budget_ms": QUALITY_TIERS[name].latency_budget_ms,
+                "requests": stats["requests"],
+                "sentences": stats["sentences"],
+                "cached_sentences": stats["cached_sentences"],
+                "avg_ms": round(stats["total_ms"] / stats["requests"], 1) if stats["requests"] else 0,
+                "max_ms": round(stats["max_ms"], 1),
+                "over_budget": stats["over_budget"],
+            }
+            for name, stats in self._stats.items()
+        }
+
+
+tier_metrics = TierMetrics()
@@ -0,0 +1,215 @@
+"""
+Usage quota accounting for metered endpoints.
+
+Credits are reserved with a single conditional statement, so the limit check
+and the debit happen atomically in the database. Two parallel requests can no
+longer both pass a Python-side check and overspend, and every request, a new
+user's first one included, needs one statement plus a commit instead of SELECT,
+UPDATE, COMMIT and REFRESH. On PostgreSQL and SQLite the statement is an
+INSERT ... ON CONFLICT DO UPDATE ... WHERE <fits> RETURNING that creates the
+user's row already debited; elsewhere it is a conditional UPDATE ... RETURNING.
+Only a reservation that fails re-reads the row, to report why. If the work
+fails afterwards, the reservation is released.
+
+When a write-behind UsageLedger is installed with use_ledger(), reservations
+are made against its in-process counters instead (see usage_ledger.py).
+"""
+import os
+from typing import NamedTuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import UserUsage
+
+
+class Usage(NamedTuple):
+    token_usage: int
+    usage_limit: int
+
+
+# Optional write-behind ledger (USAGE_ACCOUNTING=write_behind)
+_ledger = None
+
+
+def use_ledger(ledger):
+    """Route reserve/release through a write-behind ledger (None to disable)"""
+    global _ledger
+    _ledger = ledger
+
+
+class PlanRequired(HTTPException):
+    """A request that needs a higher usage limit (plan) than the user has (403)"""
+
+    def __init__(self, min_limit: int):
+        self.min_limit = min_limit
+        super().__init__(status_code=403, detail=f"This request needs a usage limit of at least {min_limit}")
+
+
+def default_usage_limit() -> int:
+    return int(os.getenv("DEFAULT_USAGE_LIMIT", 400))
+
+
+def check_limit(token_usage: int, usage_limit: int, tokens: int):
+    """Raise a 403 HTTPException if tokens do not fit in the remaining quota"""
+    # Check if user has exceeded usage limit
+    if token_usage >= usage_limit:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Usage limit exceeded. Current usage: {token_usage}/{usage_limit}"
+        )
+
+    # Check if this request would exceed the limit
+    if token_usage + tokens > usage_limit:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Request would exceed usage limit. Current usage: {token_usage}/{usage_limit}"
+        )
+
+
+# Dialects that support INSERT ... ON CONFLICT ... RETURNING
+_UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+async def get_or_create_user(db: AsyncSession, user_id: str):
+    """
+    Get user or create if doesn't exist.
+    Uses a single INSERT ... ON CONFLICT ... RETURNING round trip, so two first
+    requests from the same user cannot collide on the unique user_id index.
+    """
+    # Create new user with default limit
+    default_limit = default_usage_limit()
+
+    insert = _UPSERT_INSERTS.get(db.bind.dialect.name)
+    if insert is None:
+        result = await db.execute(select(UserUsage).where(UserUsage.user_id == user_id))
+        user = result.scalar_one_or_none()
+
+        if not user:
+            user = UserUsage(user_id=user_id, usage_limit=default_limit)
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+        return user
+
+    stmt = insert(UserUsage).values(
+        user_id=user_id, word_count=0, token_usage=0, usage_limit=default_limit
+    )
+    # A no-op update (rather than DO NOTHING) makes RETURNING yield the existing row
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserUsage.user_id],
+        set_={"user_id": stmt.excluded.user_id},
+    ).returning(UserUsage)
+
+    result = await db.execute(
+        select(UserUsage).from_statement(stmt).execution_options(populate_existing=True)
+    )
+    user = result.scalar_one()
+    await db.commit()
+    return user
+
+
+async def _try_reserve(db: AsyncSession, user_id: str, tokens: int, words: int, min_limit: int = 0):
+    """Debit tokens/words if they fit, creating a new user's row in the same statement; None if not"""
+    fits = [
+        UserUsage.token_usage < UserUsage.usage_limit,
+        UserUsage.token_usage + tokens <= UserUsage.usage_limit,
+    ]
+    if min_limit:
+        fits.append(UserUsage.usage_limit >= min_limit)
+
+    default_limit = default_usage_limit()
+    insert = _UPSERT_INSERTS.get(db.bind.dialect.name)
+    # A new user whose fresh account would not fit the request falls back to the UPDATE, which
+    # matches no row; reserve_credits then creates the user and reports why it does not fit
+    if insert is not None and 0 < default_limit and tokens <= default_limit and min_limit <= default_limit:
+        stmt = insert(UserUsage).values(
+            user_id=user_id, word_count=words, token_usage=tokens, usage_limit=default_limit
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserUsage.user_id],
+            set_={
+                "token_usage": UserUsage.token_usage + tokens,
+                "word_count": UserUsage.word_count + words,
+                # ON CONFLICT DO UPDATE does not apply the column's onupdate
+                "updated_at": func.now(),
+            },
+            where=and_(*fits),
+        ).returning(UserUsage.token_usage, UserUsage.usage_limit)
+    else:
+        stmt = (
+            update(UserUsage)
+            .where(UserUsage.user_id == user_id, *fits)
+            .values(
+                token_usage=UserUsage.token_usage + tokens,
+                word_count=UserUsage.word_count + words,
+            )
+            .returning(UserUsage.token_usage, UserUsage.usage_limit)
+            .execution_options(synchronize_session=False)
+        )
+    row = (await db.execute(stmt)).one_or_none()
+    await db.commit()
+    return Usage(*row) if row else None
+
+
+async def reserve_credits(db: AsyncSession, user_id: str, tokens: int, words: int,
+                          min_limit: int = 0) -> Usage:
+    """
+    Atomically check the user's limit and debit tokens/words in one statement.
+    Creates the user on first use. Raises a 403 HTTPException if the request
+    does not fit in the remaining quota, or PlanRequired (403) if the user's
+    usage limit is below min_limit, in which case nothing is debited.
+    """
+    if _ledger is not None:
+        return await _ledger.reserve(db, user_id, tokens, words, min_limit)
+
+    usage = await _try_reserve(db, user_id, tokens, words, min_limit)
+    if usage is not None:
+        return usage
+
+    # Nothing was debited. Re-read the row to report why; retry only while the request
+    # still fits (e.g. a concurrent request released its reservation in between).
+    while True:
+        current = await get_or_create_user(db, user_id)
+        if current.usage_limit < min_limit:
+            raise PlanRequired(min_limit)
+        check_limit(current.token_usage, current.usage_limit, tokens)
+        usage = await _try_reserve(db, user_id, tokens, words, min_limit)
+        if usage is not None:
+            return usage
+
+
+async def check_credits(db: AsyncSession, user_id: str, tokens: int) -> Usage:
+    """
+    Raise a 403 HTTPException if tokens do not fit in the remaining quota,
+    without debiting anything (e.g. before queueing work that is charged later).
+    """
+    if _ledger is not None:
+        return await _ledger.check(db, user_id, tokens)
+
+    user = await get_or_create_user(db, user_id)
+    check_limit(user.token_usage, user.usage_limit, tokens)
+    return Usage(user.token_usage, user.usage_limit)
+
+
+async def release_credits(db: AsyncSession, user_id: str, tokens: int, words: int):
+    """Give back a reservation when the metered work fails"""
+    if _ledger is not None:
+        _ledger.release(user_id, tokens, words)
+        return
+
+    await db.execute(
+        update(UserUsage)
+        .where(UserUsage.user_id == user_id)
+        .values(
+            token_usage=UserUsage.token_usage - tokens,
+            word_count=UserUsage.word_count - words,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
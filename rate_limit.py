@@ -0,0 +1,226 @@
+"""
+Per-user token-bucket rate limiting for metered endpoints.
+
+The lifetime usage_limit does not stop one user from sending requests as fast
+as they can and taking all of the inference capacity. Every metered request
+first takes tokens from the user's bucket. A bucket holds up to `burst` tokens
+and refills at `rate` tokens per second. A request costs one token, or one per
+item for batch endpoints. When the bucket is short, the request is rejected
+with 429 and a Retry-After header. This happens before any database access or
+model work, so abusive traffic costs almost nothing.
+
+A batch may cost more than the bucket holds. It is let through once the bucket
+is full and leaves the bucket in debt, so the user waits for the whole cost to
+refill before the next request. Large batches thus cost exactly one token per
+item, and a batch never needs to fit in the bucket.
+
+Rate limiting is off by default (RATE_LIMIT_ENABLED), so existing clients are
+not throttled on upgrade.
+
+Limits depend on the user's plan: "paid" once their usage limit has been raised
+to PAID_TIER_MIN_LIMIT, otherwise "free". The plan is learned from the usage
+limits seen by earlier requests and cached in process, so the check itself never
+touches the database. Users not seen yet get the free limits.
+
+Buckets live in a BucketBackend:
+- memory (default): in process; with several workers each one limits separately
+- redis: shared by all workers and nodes, updated atomically by a Lua script
+  (needs `pip install redis` and RATE_LIMIT_REDIS_URL)
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Tuple
+
+from fastapi import HTTPException
+
+from metrics import RATE_LIMITED
+from quality_tiers import PAID_TIER_MIN_LIMIT
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+# Users whose bucket and plan are kept in memory; least recently seen are dropped first
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", 100000))
+
+
+class RateLimit(NamedTuple):
+    rate: float  # tokens added per second
+    burst: float  # bucket size
+
+
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "free": RateLimit(
+        rate=float(os.getenv("RATE_LIMIT_FREE_RPS", 1)),
+        burst=float(os.getenv("RATE_LIMIT_FREE_BURST", 5)),
+    ),
+    "paid": RateLimit(
+        rate=float(os.getenv("RATE_LIMIT_PAID_RPS", 10)),
+        burst=float(os.getenv("RATE_LIMIT_PAID_BURST", 50)),
+    ),
+}
+
+
+class RateLimited(HTTPException):
+    """A request rejected because the user's bucket is empty (429 with Retry-After)"""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+def plan_for_limit(usage_limit: int) -> str:
+    return "paid" if usage_limit >= PAID_TIER_MIN_LIMIT else "free"
+
+
+class BucketBackend:
+    """Storage for token buckets"""
+
+    async def take(self, key: str, cost: float, limit: RateLimit) -> Tuple[bool, float]:
+        """
+        Take cost tokens if the bucket has them, or is full when cost exceeds its size (the bucket
+        then goes negative); returns (allowed, seconds until the request would be allowed)
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InMemoryBucketBackend(BucketBackend):
+    """Buckets in a bounded LRU dict of key -> [tokens, last update]"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_USERS):
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, key, cost, limit):
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = limit.burst
+        else:
+            tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            self._buckets.move_to_end(key)
+
+        need = min(cost, limit.burst)
+        allowed = tokens >= need
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = [tokens, now]
+        if len(self._buckets) > self.max_keys:
+            # An evicted bucket comes back full, which an idle user's bucket would be anyway
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (need - tokens) / limit.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# KEYS[1]: bucket; ARGV: rate, burst, cost. Uses the Redis clock so every client agrees on time.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local need = math.min(cost, burst)
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= need then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+-- Keep the key until it has refilled, including any debt
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketBackend(BucketBackend):
+    """Buckets shared by every worker through Redis; fails open if Redis is unavailable"""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "humanizer:ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires `pip install redis`")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self.errors = 0
+
+    async def take(self, key, cost, limit):
+        try:
+            allowed, tokens = await self._take(keys=[self.prefix + key], args=[limit.rate, limit.burst, cost])
+        except Exception:
+            # Rate limiting must not take the API down with it
+            self.errors += 1
+            return True, 0.0
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (min(cost, limit.burst) - tokens) / limit.rate
+
+    async def close(self):
+        # aclose() in redis-py 5, close() before
+        close = getattr(self._client, "aclose", None) or self._client.close
+        await close()
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND) -> BucketBackend:
+    if name == "memory":
+        return InMemoryBucketBackend()
+    if name == "redis":
+        return RedisBucketBackend()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {name!r}, expected memory or redis")
+
+
+class RateLimiter:
+    """Per-user token buckets with limits by plan"""
+
+    def __init__(self, backend: BucketBackend, limits: Dict[str, RateLimit] = None,
+                 max_users: int = RATE_LIMIT_MAX_USERS):
+        self.backend = backend
+        self.limits = limits or RATE_LIMITS
+        self.max_users = max(1, max_users)
+        self._plans: "OrderedDict[str, str]" = OrderedDict()
+        self.allowed = 0
+        self.rejected = {plan: 0 for plan in self.limits}
+
+    def set_limit(self, user_id: str, usage_limit: int):
+        """Record a user's usage limit (seen on a request or changed by an admin) to pick their plan"""
+        self._plans[user_id] = plan_for_limit(usage_limit)
+        self._plans.move_to_end(user_id)
+        if len(self._plans) > self.max_users:
+            self._plans.popitem(last=False)
+
+    def plan(self, user_id: str) -> str:
+        return self._plans.get(user_id, "free")
+
+    async def check(self, user_id: str, endpoint: str, cost: float = 1):
+        """Take cost tokens from the user's bucket or raise RateLimited"""
+        plan = self.plan(user_id)
+        limit = self.limits[plan]
+
+        allowed, wait = await self.backend.take(user_id, cost, limit)
+        if allowed:
+            self.allowed += 1
+            return
+        self.rejected[plan] += 1
+        RATE_LIMITED.inc(endpoint, plan)
+        raise RateLimited(
+            f"Rate limit exceeded ({limit.rate:g} requests/s, burst {limit.burst:g}), retry later",
+            max(1, math.ceil(wait))
+        )
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "limits": {plan: limit._asdict() for plan, limit in self.limits.items()},
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+            "known_users": len(self._plans),
+        }
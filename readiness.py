@@ -0,0 +1,51 @@
+"""
+Model load state for the /ready endpoint.
+
+Models are loaded in the background after startup so /health and the
+non-model endpoints answer right away. Each model (and the optional warm-up
+inference) is tracked as pending -> loading -> ready or failed, with its load
+time. The service is ready once every tracked step is ready.
+"""
+import os
+import threading
+import time
+from typing import Callable
+
+BACKGROUND_MODEL_LOADING = os.getenv("BACKGROUND_MODEL_LOADING", "true").lower() in ("1", "true", "yes")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+class ModelStatus:
+    """Load state and load time of each model"""
+
+    def __init__(self, *names: str):
+        self._lock = threading.Lock()
+        self._models = {
+            name: {"state": "pending", "load_seconds": None, "error": None} for name in names
+        }
+
+    def track(self, name: str, load: Callable[[], None]):
+        """Run load() and record its state; does nothing if name is already ready"""
+        with self._lock:
+            model = self._models.setdefault(name, {"state": "pending", "load_seconds": None, "error": None})
+            if model["state"] == "ready":
+                return
+            model.update(state="loading", error=None)
+
+        start = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            with self._lock:
+                model.update(state="failed", error=str(e), load_seconds=round(time.perf_counter() - start, 3))
+            raise
+        with self._lock:
+            model.update(state="ready", load_seconds=round(time.perf_counter() - start, 3))
+
+    @property
+    def ready(self) -> bool:
+        return all(model["state"] == "ready" for model in self._models.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: dict(model) for name, model in self._models.items()}
@@ -0,0 +1,64 @@
+"""
+Sentence segmentation for /humanize.
+
+Only sentence boundaries are needed, so running the full en_core_web_sm pipeline
+(tagger, parser, NER, lemmatizer) wastes CPU, memory and startup time.
+SEGMENTER_MODE selects how much of spaCy is loaded:
+- full:        the whole pipeline (previous behaviour)
+- parser:      tok2vec + dependency parser only; same boundaries as full (default)
+- senter:      the statistical sentence recognizer only; much faster, slightly less accurate
+- sentencizer: rule-based punctuation splitting, no model weights at all
+
+spaCy is imported when the pipeline is loaded, not when this module is imported.
+"""
+import os
+from typing import List
+
+SEGMENTER_MODE = os.getenv("SEGMENTER_MODE", "parser").lower()
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+SEGMENTER_PIPE_BATCH_SIZE = int(os.getenv("SEGMENTER_PIPE_BATCH_SIZE", 32))
+
+SEGMENTER_MODES = ("full", "parser", "senter", "sentencizer")
+
+# Components that do not affect sentence boundaries
+_NON_BOUNDARY_COMPONENTS = ["tagger", "attribute_ruler", "lemmatizer", "ner"]
+
+
+def load_pipeline(mode: str = SEGMENTER_MODE, model: str = SPACY_MODEL):
+    """Load the smallest spaCy pipeline that produces doc.sents for the given mode"""
+    import spacy
+
+    if mode == "full":
+        return spacy.load(model)
+    if mode == "parser":
+        return spacy.load(model, exclude=_NON_BOUNDARY_COMPONENTS)
+    if mode == "senter":
+        nlp = spacy.load(model, exclude=_NON_BOUNDARY_COMPONENTS + ["parser"])
+        nlp.enable_pipe("senter")
+        return nlp
+    if mode == "sentencizer":
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        return nlp
+    raise ValueError(f"Unknown SEGMENTER_MODE {mode!r}, expected one of {', '.join(SEGMENTER_MODES)}")
+
+
+class Segmenter:
+    """Splits text into stripped, non-empty sentences"""
+
+    def __init__(self, mode: str = SEGMENTER_MODE, model: str = SPACY_MODEL,
+                 batch_size: int = SEGMENTER_PIPE_BATCH_SIZE):
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.nlp = load_pipeline(mode, model)
+
+    @staticmethod
+    def _sentences(doc) -> List[str]:
+        return [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+
+    def segment(self, text: str) -> List[str]:
+        return self._sentences(self.nlp(text))
+
+    def segment_many(self, texts: List[str]) -> List[List[str]]:
+        """Segment several texts with nlp.pipe batching"""
+        return [self._sentences(doc) for doc in self.nlp.pipe(texts, batch_size=self.batch_size)]
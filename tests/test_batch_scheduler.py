@@ -0,0 +1,115 @@
+"""
+Weighted-fair scheduling and aging in the paraphrase batcher, with a stub engine.
+"""
+import asyncio
+from collections import Counter
+
+from batch_scheduler import ParaphraseBatcher
+from quality_tiers import get_tier
+
+WEIGHTS = {"paid": 8, "free": 2, "bulk": 1}
+
+
+class StubEngine:
+    """Returns each sentence as its own paraphrase and records the batches it was given"""
+
+    def __init__(self):
+        self.batches = []
+
+    def paraphrase_batch(self, sentences, **settings):
+        self.batches.append(list(sentences))
+        return [[(sentence, 0)] for sentence in sentences]
+
+
+class InlineExecutor:
+    """Runs engine calls on the event loop, one at a time"""
+
+    max_workers = 1
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def new_batcher(engine, max_batch, max_priority_wait_ms=60_000):
+    return ParaphraseBatcher(
+        engine, InlineExecutor(), max_batch=max_batch, max_wait_ms=0, max_in_flight=1,
+        weights=WEIGHTS, max_priority_wait_ms=max_priority_wait_ms,
+    )
+
+
+def queue(batcher, priority, count):
+    sentences = [f"{priority} {i}" for i in range(count)]
+    return asyncio.ensure_future(batcher.paraphrase(sentences, get_tier("balanced"), priority))
+
+
+def priorities(batch):
+    return Counter(sentence.split()[0] for sentence in batch)
+
+
+def test_contended_batches_are_shared_by_weight():
+    engine = StubEngine()
+
+    async def run():
+        batcher = new_batcher(engine, max_batch=11)
+        requests = [queue(batcher, priority, 33) for priority in ("bulk", "free", "paid")]
+        # Let every request queue its sentences before the first batch is taken
+        await asyncio.sleep(0)
+        batcher.start()
+        results = await asyncio.gather(*requests)
+        await batcher.stop()
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(run())
+    assert [len(result) for result in results] == [33, 33, 33]
+    # While all classes are waiting, each batch of 11 has 8 paid, 2 free and 1 bulk sentence
+    for batch in engine.batches[:4]:
+        assert priorities(batch) == {"paid": 8, "free": 2, "bulk": 1}
+    # No class is shut out once paid runs dry
+    assert sum(len(batch) for batch in engine.batches) == 99
+    assert stats["priority"]["dispatched"] == {"paid": 33, "free": 33, "bulk": 33}
+    assert stats["priority"]["aged"] == {"paid": 0, "free": 0, "bulk": 0}
+
+
+def test_overdue_bulk_sentence_goes_first():
+    engine = StubEngine()
+
+    async def run():
+        batcher = new_batcher(engine, max_batch=4, max_priority_wait_ms=1000)
+        bulk = queue(batcher, "bulk", 1)
+        paid = queue(batcher, "paid", 20)
+        await asyncio.sleep(0)
+        # The bulk sentence has waited past PRIORITY_MAX_WAIT_MS, the paid ones just arrived
+        now = asyncio.get_running_loop().time()
+        batcher._pending = [
+            item._replace(enqueued=now - 2) if item.priority == "bulk" else item._replace(enqueued=now)
+            for item in batcher._pending
+        ]
+        tier, batch = batcher._next_batch(now)
+        await batcher._run_batch(tier, batch)
+        served = await bulk
+
+        batcher.start()
+        await paid
+        await batcher.stop()
+        return [item.sentence for item in batch], served, batcher.stats()
+
+    batch, served, stats = asyncio.run(run())
+    assert batch == ["bulk 0", "paid 0", "paid 1", "paid 2"]
+    assert served == [[("bulk 0", 0)]]
+    assert stats["priority"]["aged"]["bulk"] == 1
+
+
+def test_batch_without_contention_is_not_held_back():
+    engine = StubEngine()
+
+    async def run():
+        batcher = new_batcher(engine, max_batch=11)
+        request = queue(batcher, "bulk", 5)
+        await asyncio.sleep(0)
+        batcher.start()
+        result = await request
+        await batcher.stop()
+        return result
+
+    assert len(asyncio.run(run())) == 5
+    assert engine.batches == [[f"bulk {i}" for i in range(5)]]
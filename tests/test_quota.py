@@ -0,0 +1,173 @@
+"""
+Atomic credit reservation in quota.py, against a temporary SQLite database (needs aiosqlite).
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import quota
+from database import Base, UserUsage
+from quota import PlanRequired, release_credits, reserve_credits
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'usage.db'}")
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(setup())
+    quota.use_ledger(None)
+    yield factory
+    asyncio.run(engine.dispose())
+
+
+async def reserve(factory, user_id, tokens, words=None, min_limit=0):
+    async with factory() as db:
+        return await reserve_credits(db, user_id, tokens, tokens if words is None else words, min_limit)
+
+
+async def release(factory, user_id, tokens):
+    async with factory() as db:
+        await release_credits(db, user_id, tokens, tokens)
+
+
+async def row(factory, user_id):
+    async with factory() as db:
+        result = await db.execute(
+            select(UserUsage.token_usage, UserUsage.word_count, UserUsage.usage_limit)
+            .where(UserUsage.user_id == user_id)
+        )
+        return result.one_or_none()
+
+
+async def set_row(factory, user_id, **values):
+    async with factory() as db:
+        await reserve_credits(db, user_id, 0, 0)
+        await db.execute(update(UserUsage).where(UserUsage.user_id == user_id).values(**values))
+        await db.commit()
+
+
+def test_new_user_is_created_already_debited(factory):
+    async def run():
+        usage = await reserve(factory, "new", 10, words=7)
+        return usage, await row(factory, "new")
+
+    usage, (token_usage, word_count, usage_limit) = asyncio.run(run())
+    assert usage == (10, 400)
+    assert (token_usage, word_count, usage_limit) == (10, 7, 400)
+
+
+def test_concurrent_reserves_never_exceed_the_limit(factory):
+    async def attempt():
+        try:
+            await reserve(factory, "user", 30)
+            return True
+        except HTTPException:
+            return False
+
+    async def run():
+        results = await asyncio.gather(*(attempt() for _ in range(20)))
+        return results.count(True), await row(factory, "user")
+
+    granted, (token_usage, _, _) = asyncio.run(run())
+    # 13 x 30 = 390 fits in 400, a 14th would not
+    assert granted == 13
+    assert token_usage == 390
+
+
+def test_request_over_the_remaining_quota_debits_nothing(factory):
+    async def run():
+        await reserve(factory, "user", 395)
+        with pytest.raises(HTTPException) as over:
+            await reserve(factory, "user", 10)
+        return over.value, await row(factory, "user")
+
+    error, (token_usage, _, _) = asyncio.run(run())
+    assert error.status_code == 403
+    assert "would exceed" in error.detail
+    assert token_usage == 395
+
+
+def test_exhausted_user_is_rejected(factory):
+    async def run():
+        await reserve(factory, "user", 400)
+        with pytest.raises(HTTPException) as exhausted:
+            await reserve(factory, "user", 1)
+        return exhausted.value
+
+    assert "Usage limit exceeded" in asyncio.run(run()).detail
+
+
+def test_new_user_request_larger_than_the_default_limit(factory):
+    async def run():
+        with pytest.raises(HTTPException) as over:
+            await reserve(factory, "new", 500)
+        return over.value, await row(factory, "new")
+
+    error, (token_usage, _, usage_limit) = asyncio.run(run())
+    # The user is still created, with nothing debited
+    assert error.status_code == 403
+    assert (token_usage, usage_limit) == (0, 400)
+
+
+def test_plan_required_debits_nothing(factory):
+    async def run():
+        with pytest.raises(PlanRequired):
+            await reserve(factory, "new", 10, min_limit=401)
+        await reserve(factory, "free", 50)
+        with pytest.raises(PlanRequired):
+            await reserve(factory, "free", 10, min_limit=401)
+        return await row(factory, "new"), await row(factory, "free")
+
+    new, free = asyncio.run(run())
+    assert new[0] == 0
+    assert free[0] == 50
+
+
+def test_paid_user_passes_min_limit(factory):
+    async def run():
+        await set_row(factory, "paid", usage_limit=1000)
+        usage = await reserve(factory, "paid", 10, min_limit=401)
+        return usage
+
+    assert asyncio.run(run()) == (10, 1000)
+
+
+def test_release_restores_the_balance(factory):
+    async def run():
+        await reserve(factory, "user", 100)
+        await reserve(factory, "user", 40)
+        await release(factory, "user", 40)
+        return await row(factory, "user")
+
+    token_usage, word_count, _ = asyncio.run(run())
+    assert (token_usage, word_count) == (100, 100)
+
+
+def test_reservation_retries_when_credits_are_released_meanwhile(factory, monkeypatch):
+    get_or_create_user = quota.get_or_create_user
+    reads = []
+
+    async def release_then_read(db, user_id):
+        # A concurrent request gives its reservation back between the failed attempt and the re-read
+        if not reads:
+            await release(factory, user_id, 20)
+        reads.append(user_id)
+        return await get_or_create_user(db, user_id)
+
+    async def run():
+        await reserve(factory, "user", 395)
+        monkeypatch.setattr(quota, "get_or_create_user", release_then_read)
+        usage = await reserve(factory, "user", 10)
+        return usage, len(reads)
+
+    usage, re_reads = asyncio.run(run())
+    assert usage == (385, 400)
+    assert re_reads == 1
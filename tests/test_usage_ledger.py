@@ -0,0 +1,162 @@
+"""
+Write-behind usage ledger: per-process logs, crash recovery and counters shared by workers.
+Runs against a temporary SQLite database (needs aiosqlite).
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import Base, UserUsage
+from usage_ledger import UsageLedger
+
+# Long enough that only explicit flush() calls write to the database
+NO_AUTO_FLUSH_MS = 3_600_000
+
+
+@pytest.fixture
+def env(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'usage.db'}")
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(setup())
+    yield factory, str(tmp_path / "usage_ledger.log")
+    asyncio.run(engine.dispose())
+
+
+def new_ledger(factory, log_path):
+    return UsageLedger(factory, log_path=log_path, flush_interval_ms=NO_AUTO_FLUSH_MS)
+
+
+async def reserve(factory, ledger, user_id, tokens):
+    async with factory() as db:
+        await ledger.reserve(db, user_id, tokens, tokens)
+
+
+async def token_usage(factory, user_id):
+    async with factory() as db:
+        result = await db.execute(select(UserUsage.token_usage).where(UserUsage.user_id == user_id))
+        return result.scalar_one()
+
+
+def crash(ledger):
+    """Stop a ledger the way a killed process would: no final flush, files and lock left behind"""
+    ledger._flush_task.cancel()
+    ledger._log.close()
+    ledger._lock.close()
+
+
+def test_starting_worker_leaves_live_worker_log_alone(env):
+    factory, log_path = env
+
+    async def run():
+        first = new_ledger(factory, log_path)
+        await first.start()
+        await reserve(factory, first, "user", 10)
+
+        second = new_ledger(factory, log_path)
+        await second.start()
+        await reserve(factory, second, "other", 3)
+
+        await first.flush()
+        await second.flush()
+        await reserve(factory, first, "user", 5)
+        await second.stop()
+        await first.stop()
+        return await token_usage(factory, "user"), await token_usage(factory, "other")
+
+    assert asyncio.run(run()) == (15, 3)
+
+
+def test_replay_after_crash(env):
+    factory, log_path = env
+
+    async def run():
+        crashed = new_ledger(factory, log_path)
+        await crashed.start()
+        await reserve(factory, crashed, "user", 10)
+        await crashed.flush()
+        await reserve(factory, crashed, "user", 7)
+        crash(crashed)
+
+        restarted = new_ledger(factory, log_path)
+        await restarted.start()
+        usage = await token_usage(factory, "user")
+        await restarted.stop()
+        return usage
+
+    assert asyncio.run(run()) == 17
+
+
+def test_segment_committed_before_crash_is_not_replayed(env):
+    factory, log_path = env
+
+    async def run():
+        crashed = new_ledger(factory, log_path)
+        await crashed.start()
+        await reserve(factory, crashed, "user", 10)
+        # Crash between the commit and deleting the sealed segment
+        crashed._delete_segments = lambda segments: None
+        await crashed.flush()
+        crash(crashed)
+
+        restarted = new_ledger(factory, log_path)
+        await restarted.start()
+        usage = await token_usage(factory, "user")
+        await restarted.stop()
+        return usage
+
+    assert asyncio.run(run()) == 10
+
+
+def test_workers_see_each_others_usage_after_a_flush(env):
+    factory, log_path = env
+
+    async def run():
+        workers = [new_ledger(factory, log_path), new_ledger(factory, log_path)]
+        for worker in workers:
+            await worker.start()
+
+        rejected = 0
+        for i in range(8):
+            worker, other = workers[i % 2], workers[1 - i % 2]
+            try:
+                await reserve(factory, worker, "user", 99)
+            except HTTPException:
+                rejected += 1
+            # One flush interval passes: the debit is committed, then the other worker re-reads it
+            await worker.flush()
+            await other.flush()
+
+        for worker in workers:
+            await worker.stop()
+        return await token_usage(factory, "user"), rejected
+
+    # 400 credits fit four reservations of 99, however they are spread over the workers
+    assert asyncio.run(run()) == (396, 4)
+
+
+def test_limit_change_reaches_other_worker_after_a_flush(env):
+    factory, log_path = env
+
+    async def run():
+        worker = new_ledger(factory, log_path)
+        await worker.start()
+        await reserve(factory, worker, "user", 300)
+
+        # Raised by /update-limit in another worker
+        async with factory() as db:
+            await db.execute(update(UserUsage).where(UserUsage.user_id == "user").values(usage_limit=1000))
+            await db.commit()
+        await worker.flush()
+        await reserve(factory, worker, "user", 300)
+        await worker.stop()
+        return await token_usage(factory, "user")
+
+    assert asyncio.run(run()) == 600
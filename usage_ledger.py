@@ -0,0 +1,394 @@
+"""
+Write-behind usage accounting (USAGE_ACCOUNTING=write_behind).
+
+In the default mode every successful metered request runs its own UPDATE and
+COMMIT against user_usage. In write-behind mode:
+- credits are reserved against in-process counters (loaded once per user)
+- each usage delta is appended to a local append-only log, then kept in memory
+- a background task aggregates deltas per user and applies them every
+  LEDGER_FLUSH_INTERVAL_MS in one bulk UPDATE
+
+Crash recovery: before each flush the live log is sealed into a segment file
+named with a unique id. The bulk UPDATE and the segment ids are committed in the
+same transaction (usage_ledger_segments table), then the files are deleted. On
+startup any leftover segments are replayed, skipping ids that were already
+committed, so every delta is applied exactly once.
+
+Every process owns its files: LEDGER_LOG_PATH.<owner>.log and its segments
+LEDGER_LOG_PATH.<owner>.<id>.seg, where the owner is the pid plus a random
+suffix. The owner holds an flock on LEDGER_LOG_PATH.<owner>.lock while it runs.
+A starting process only recovers the files of owners whose lock is free, i.e.
+that have exited, so it never touches the log of a live worker. Startups are
+serialised by an flock on LEDGER_LOG_PATH.lock, so two workers starting at once
+do not recover the same files.
+
+Counters are per process. After every flush interval, each process re-reads
+usage and limits of the users it holds counters for. The database then has the
+deltas every worker has flushed, and the process adds back its own unflushed
+ones. So with several workers a user can overspend by at most what the other
+workers reserve within about one flush interval, and a limit changed by
+/update-limit in one worker reaches the others within one interval. Counters
+of users idle for LEDGER_ACCOUNT_IDLE_TTL seconds are dropped and loaded again
+on next use.
+"""
+import asyncio
+import glob
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no gunicorn workers, so no other owner can be running
+    fcntl = None
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from database import UsageLedgerSegment, UserUsage
+from quota import PlanRequired, Usage, check_limit, get_or_create_user
+
+USAGE_ACCOUNTING = os.getenv("USAGE_ACCOUNTING", "direct").lower()
+LEDGER_FLUSH_INTERVAL_MS = float(os.getenv("LEDGER_FLUSH_INTERVAL_MS", 500))
+LEDGER_LOG_PATH = os.getenv("LEDGER_LOG_PATH", "usage_ledger.log")
+LEDGER_FSYNC = os.getenv("LEDGER_FSYNC", "false").lower() in ("1", "true", "yes")
+LEDGER_ACCOUNT_IDLE_TTL = float(os.getenv("LEDGER_ACCOUNT_IDLE_TTL", 300))
+
+_user_usage = UserUsage.__table__
+_segments = UsageLedgerSegment.__table__
+
+# One statement executed with a parameter list for all users in a flush
+_BULK_UPDATE = (
+    update(_user_usage)
+    .where(_user_usage.c.user_id == bindparam("b_user_id"))
+    .values(
+        token_usage=_user_usage.c.token_usage + bindparam("b_tokens"),
+        word_count=_user_usage.c.word_count + bindparam("b_words"),
+    )
+)
+# Users re-read per statement after a flush, within the bound-parameter limits of SQLite
+_SYNC_CHUNK = 500
+
+
+def _try_lock(path: str):
+    """Open path and take an exclusive flock without waiting; None if another process holds it"""
+    lock = open(path, "a")
+    if fcntl:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+    return lock
+
+
+class UsageLedger:
+    """In-process usage counters with a durable log and batched DB flushes"""
+
+    def __init__(self, session_factory, log_path: str = LEDGER_LOG_PATH,
+                 flush_interval_ms: float = LEDGER_FLUSH_INTERVAL_MS, fsync: bool = LEDGER_FSYNC,
+                 account_idle_ttl: float = LEDGER_ACCOUNT_IDLE_TTL):
+        self.session_factory = session_factory
+        self.base_path = log_path
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.log_path = f"{log_path}.{self.owner}.log"
+        self.lock_path = f"{log_path}.{self.owner}.lock"
+        self.flush_interval = max(1.0, flush_interval_ms) / 1000
+        self.fsync = fsync
+
+        self.account_idle_ttl = account_idle_ttl
+        # user_id -> [token_usage, usage_limit, last used] as seen by this process
+        self._accounts: Dict[str, list] = {}
+        # user_id -> [tokens, words] not yet handed to a flush
+        self._pending: Dict[str, List[int]] = {}
+        # user_id -> [tokens, words] currently being written by a flush
+        self._flushing: Dict[str, List[int]] = {}
+        # Sealed segments whose deltas are back in _pending after a failed flush
+        self._unflushed_segments: List[str] = []
+        # Segment ids whose files are deleted; their table rows can be removed
+        self._removed_segments: List[str] = []
+
+        self._log = None
+        self._lock = None
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.flush_errors = 0
+
+    async def start(self):
+        """Replay segments left by exited processes and start flushing"""
+        startup_lock = open(f"{self.base_path}.lock", "a")
+        try:
+            if fcntl:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, fcntl.flock, startup_lock.fileno(), fcntl.LOCK_EX
+                )
+            # Claim this owner before recovering, so a process starting after us sees it as live
+            self._lock = _try_lock(self.lock_path)
+            await self._recover()
+        finally:
+            startup_lock.close()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        flushed = False
+        try:
+            await self.flush()
+            flushed = not self._unflushed_segments
+        except Exception as e:
+            # Deltas stay in the log segments and are replayed by the next process to start
+            print(f"Usage ledger final flush failed: {e}")
+        if self._log:
+            self._log.close()
+            self._log = None
+            if flushed and os.path.getsize(self.log_path) == 0:
+                os.remove(self.log_path)
+        if self._lock:
+            if flushed:
+                os.remove(self.lock_path)
+            self._lock.close()
+            self._lock = None
+
+    async def _account(self, db, user_id: str) -> list:
+        account = self._accounts.get(user_id)
+        if account is None:
+            # No flush may run meanwhile, so the row and the unflushed deltas do not overlap
+            async with self._flush_lock:
+                account = self._accounts.get(user_id)
+                if account is None:
+                    user = await get_or_create_user(db, user_id)
+                    unflushed_tokens = self._pending.get(user_id, [0, 0])[0]
+                    account = [user.token_usage + unflushed_tokens, user.usage_limit, 0.0]
+                    self._accounts[user_id] = account
+        account[2] = time.monotonic()
+        return account
+
+    async def check(self, db, user_id: str, tokens: int) -> Usage:
+        """Check the limit against the in-process counters without debiting"""
+        account = await self._account(db, user_id)
+        check_limit(account[0], account[1], tokens)
+        return Usage(account[0], account[1])
+
+    async def reserve(self, db, user_id: str, tokens: int, words: int, min_limit: int = 0) -> Usage:
+        """Check the plan and limit, then debit usage against the in-process counters"""
+        account = await self._account(db, user_id)
+        if account[1] < min_limit:
+            raise PlanRequired(min_limit)
+        check_limit(account[0], account[1], tokens)
+        account[0] += tokens
+        self._record(user_id, tokens, words)
+        return Usage(account[0], account[1])
+
+    def release(self, user_id: str, tokens: int, words: int):
+        """Give back a reservation when the metered work fails"""
+        account = self._accounts.get(user_id)
+        if account is not None:
+            account[0] -= tokens
+        self._record(user_id, -tokens, -words)
+
+    def set_limit(self, user_id: str, usage_limit: int):
+        """Keep the in-process counter in sync after an admin limit change"""
+        account = self._accounts.get(user_id)
+        if account is not None:
+            account[1] = usage_limit
+
+    def unflushed(self, user_id: str):
+        """(tokens, words) recorded for user_id but not yet committed to the database"""
+        pending = self._pending.get(user_id, [0, 0])
+        flushing = self._flushing.get(user_id, [0, 0])
+        return pending[0] + flushing[0], pending[1] + flushing[1]
+
+    def _record(self, user_id: str, tokens: int, words: int):
+        # Log first, so the delta survives a crash once the request returns
+        self._log.write(json.dumps([user_id, tokens, words]) + "\n")
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+        delta = self._pending.setdefault(user_id, [0, 0])
+        delta[0] += tokens
+        delta[1] += words
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"Usage ledger flush failed, will retry: {e}")
+
+    async def flush(self):
+        """Apply all pending deltas to the database in one bulk statement, then re-sync the counters"""
+        async with self._flush_lock:
+            if self._pending:
+                await self._flush_pending()
+            await self._sync_accounts()
+
+    async def _flush_pending(self):
+        deltas, self._pending = self._pending, {}
+        segments = self._unflushed_segments + [self._seal()]
+        self._unflushed_segments = []
+        self._flushing = deltas
+        try:
+            await self._apply(deltas, segments)
+        except Exception:
+            # Keep the deltas and their segments for the next attempt
+            for user_id, (tokens, words) in deltas.items():
+                delta = self._pending.setdefault(user_id, [0, 0])
+                delta[0] += tokens
+                delta[1] += words
+            self._unflushed_segments = segments
+            raise
+        finally:
+            self._flushing = {}
+
+        self._delete_segments(segments)
+        self.flushes += 1
+
+    def _seal(self) -> str:
+        """Close the live log, rename it to a new segment and reopen an empty log"""
+        self._log.close()
+        segment = self._new_segment_path()
+        os.replace(self.log_path, segment)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        return segment
+
+    def _new_segment_path(self) -> str:
+        return f"{self.base_path}.{self.owner}.{uuid.uuid4().hex}.seg"
+
+    def _owner_of(self, path: str) -> Optional[str]:
+        """Owner part of "<base>.<owner>.log/.lock" or "<base>.<owner>.<id>.seg"""
+        parts = os.path.basename(path)[len(os.path.basename(self.base_path)) + 1:].split(".")
+        if parts[-1] == "seg":
+            # Segments of the single log used before per-process logs ("<base>.<id>.seg") have none
+            return parts[0] if len(parts) == 3 else None
+        return parts[0]
+
+    async def _apply(self, deltas: Dict[str, List[int]], segments: List[str]):
+        async with self.session_factory() as db:
+            params = [
+                {"b_user_id": user_id, "b_tokens": tokens, "b_words": words}
+                for user_id, (tokens, words) in deltas.items()
+                if tokens or words
+            ]
+            if params:
+                await db.execute(_BULK_UPDATE, params)
+            await db.execute(
+                insert(_segments), [{"segment": os.path.basename(path)} for path in segments]
+            )
+            if self._removed_segments:
+                await db.execute(delete(_segments).where(_segments.c.segment.in_(self._removed_segments)))
+            await db.commit()
+        self._removed_segments = []
+
+    async def _sync_accounts(self):
+        """Re-read usage and limits, so other workers' usage and limit changes show up here"""
+        idle_before = time.monotonic() - self.account_idle_ttl
+        for user_id, account in list(self._accounts.items()):
+            if account[2] < idle_before and user_id not in self._pending:
+                del self._accounts[user_id]
+
+        user_ids = list(self._accounts)
+        async with self.session_factory() as db:
+            for i in range(0, len(user_ids), _SYNC_CHUNK):
+                rows = await db.execute(
+                    select(UserUsage.user_id, UserUsage.token_usage, UserUsage.usage_limit)
+                    .where(UserUsage.user_id.in_(user_ids[i:i + _SYNC_CHUNK]))
+                )
+                for user_id, token_usage, usage_limit in rows:
+                    account = self._accounts.get(user_id)
+                    if account is not None:
+                        # The row has every flushed delta; add back the ones recorded since
+                        account[0] = token_usage + self._pending.get(user_id, [0, 0])[0]
+                        account[1] = usage_limit
+
+    def _delete_segments(self, segments: List[str]):
+        for path in segments:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._removed_segments.append(os.path.basename(path))
+
+    async def _recover(self):
+        """Apply deltas from the logs and segments of processes that have exited"""
+        pattern = glob.escape(self.base_path)
+        live, exited = set(), []
+        for path in glob.glob(f"{pattern}.*.lock"):
+            owner = self._owner_of(path)
+            if owner == self.owner:
+                continue
+            lock = _try_lock(path)
+            if lock is None:
+                live.add(owner)
+            else:
+                exited.append((path, lock))
+        try:
+            # Live logs of exited owners, and the single log used before per-process logs
+            logs = [f"{self.base_path}.{self._owner_of(path)}.log" for path, _ in exited] + [self.base_path]
+            for log in logs:
+                if os.path.exists(log):
+                    if os.path.getsize(log) > 0:
+                        os.replace(log, self._new_segment_path())
+                    else:
+                        os.remove(log)
+
+            segments = sorted(
+                path for path in glob.glob(f"{pattern}.*.seg") if self._owner_of(path) not in live
+            )
+            if segments:
+                await self._replay(segments)
+        finally:
+            for path, lock in exited:
+                os.remove(path)
+                lock.close()
+
+    async def _replay(self, segments: List[str]):
+        """Apply the deltas of segments not yet committed, then delete all of them"""
+        names = [os.path.basename(path) for path in segments]
+        async with self.session_factory() as db:
+            result = await db.execute(select(_segments.c.segment).where(_segments.c.segment.in_(names)))
+            applied = set(result.scalars())
+
+        deltas: Dict[str, List[int]] = {}
+        replay = []
+        for path in segments:
+            if os.path.basename(path) in applied:
+                continue
+            replay.append(path)
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        user_id, tokens, words = json.loads(line)
+                    except ValueError:
+                        # Partially written last line of a crashed process
+                        continue
+                    delta = deltas.setdefault(user_id, [0, 0])
+                    delta[0] += tokens
+                    delta[1] += words
+
+        if replay:
+            await self._apply(deltas, replay)
+        self._delete_segments(segments)
+        print(f"Usage ledger replayed {len(replay)} segment(s) for {len(deltas)} user(s)")
+
+    def stats(self) -> dict:
+        return {
+            "accounts": len(self._accounts),
+            "pending_users": len(self._pending),
+            "unflushed_segments": len(self._unflushed_segments),
+            "flush_interval_ms": self.flush_interval * 1000,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
@@ -0,0 +1,57 @@
+"""
+Shared async HTTP client for the Winston AI detection API.
+
+A single httpx.AsyncClient is created at startup and closed at shutdown, so
+detection calls reuse keep-alive connections instead of opening a new TCP/TLS
+connection each time, and never block the event loop. HTTP/2 is used when the
+optional `h2` package is installed.
+"""
+import os
+
+import httpx
+
+WINSTON_API_URL = os.getenv("WINSTON_API_URL", "https://api.gowinston.ai/v2/ai-content-detection")
+WINSTON_POOL_SIZE = int(os.getenv("WINSTON_POOL_SIZE", 20))
+WINSTON_CONNECT_TIMEOUT = float(os.getenv("WINSTON_CONNECT_TIMEOUT", 5))
+WINSTON_READ_TIMEOUT = float(os.getenv("WINSTON_READ_TIMEOUT", 60))
+WINSTON_HTTP2 = os.getenv("WINSTON_HTTP2", "auto").lower()
+
+
+def _http2_enabled() -> bool:
+    if WINSTON_HTTP2 in ("0", "false", "no", "off"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class WinstonClient:
+    """Pooled async client for Winston AI content detection"""
+
+    def __init__(self, url: str = WINSTON_API_URL,
+                 pool_size: int = WINSTON_POOL_SIZE,
+                 connect_timeout: float = WINSTON_CONNECT_TIMEOUT,
+                 read_timeout: float = WINSTON_READ_TIMEOUT):
+        self.url = url
+        self.http2 = _http2_enabled()
+        self._client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def detect(self, text: str, token: str) -> httpx.Response:
+        """Send text to Winston AI and return the raw response"""
+        return await self._client.post(
+            self.url,
+            json={"text": text},
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            },
+        )
+
+    async def close(self):
+        await self._client.aclose()